@@ -0,0 +1,515 @@
+"""
+Card analysis pipeline: Gemini identification/grading, market pricing and AI price fallback
+"""
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from image_fingerprint import (
+    ANALYSIS_CACHE_ENABLED, dhash, find_cached_analysis, store_analysis
+)
+from image_preprocess import preprocess_image
+from inference import gemini
+from pokemon_api import pokemon_api
+from singleflight import SingleFlight
+
+# Seconds to wait for a Pokemon API price before also asking Gemini for an estimate
+PRICE_HEDGE_DELAY = float(os.getenv("PRICE_HEDGE_DELAY", "2.0"))
+# Total seconds the pricing stage may take before giving up on both sources
+PRICE_BUDGET = float(os.getenv("PRICE_BUDGET", "15.0"))
+
+# Coalesces identical concurrent AI price estimates into one Gemini call
+price_estimate_flights = SingleFlight("gemini_price_estimate")
+
+price_hedge_counts = {"lookups": 0, "hedged": 0, "api_wins": 0, "ai_wins": 0, "budget_exceeded": 0}
+
+
+class GradingCondition(BaseModel):
+    score: float
+    description: str
+
+
+class CardAnalysisResponse(BaseModel):
+    card_name: str
+    estimated_price: str
+    details: str
+    centering: Optional[GradingCondition] = None
+    corners: Optional[GradingCondition] = None
+    edges: Optional[GradingCondition] = None
+    surface: Optional[GradingCondition] = None
+    overall_grade: Optional[float] = None
+    # Real market data from Pokemon API
+    market_price: Optional[float] = None
+    price_source: Optional[str] = None  # "api" or "ai"
+    tcg_player_id: Optional[str] = None
+    set_name: Optional[str] = None
+    card_number: Optional[str] = None
+    rarity: Optional[str] = None
+    # PSA prices if available
+    psa_10_price: Optional[float] = None
+    psa_9_price: Optional[float] = None
+    psa_8_price: Optional[float] = None
+
+    is_authentic: Optional[bool] = None
+    authenticity_confidence: Optional[float] = None
+    authenticity_notes: Optional[str] = None
+
+
+async def estimate_price_with_ai(card_name: str, set_name: Optional[str]) -> str:
+    """Ask Gemini for a price estimate, sharing one call across concurrent identical requests"""
+    key = (card_name.strip().lower(), (set_name or "").strip().lower())
+
+    async def generate():
+        price_prompt = f"What is the approximate market price for a {card_name} from {set_name or 'unknown set'} in USD? Provide just a price range like '$X - $Y' or single value '$X'."
+        price_response = await gemini.generate_content(price_prompt)
+        return price_response.text.strip()
+
+    return await price_estimate_flights.do(key, generate)
+
+
+async def _market_lookup(card_name: str, set_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Pokemon API data for the identified card, or None if it isn't found or the lookup fails"""
+    print(f"   🔑 Pokemon API Key configured - searching database...")
+    if set_name:
+        print(f"   🔍 Searching for: '{card_name}' in set '{set_name}'")
+    else:
+        print(f"   🔍 Searching for: '{card_name}' (no set specified)")
+
+    try:
+        card_data = await pokemon_api.get_card_with_psa_data(card_name, set_name)
+    except Exception as api_error:
+        print(f"   ❌ Error fetching real prices: {api_error}")
+        return None
+
+    if not card_data:
+        print(f"   ⚠️  Card '{card_name}' not found in Pokemon API")
+    return card_data
+
+
+def _has_market_price(card_data: Dict[str, Any]) -> bool:
+    price_info = pokemon_api.format_price_data(card_data)
+    return bool(price_info["market_price"] or price_info["price_range"])
+
+
+async def resolve_price(
+    card_name: str,
+    set_name: Optional[str],
+    hedge_delay: float = PRICE_HEDGE_DELAY,
+    budget: float = PRICE_BUDGET
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Price a card from the Pokemon API, hedged with a Gemini estimate
+
+    The API lookup starts first. If it has no price after `hedge_delay`
+    seconds (or finishes sooner without one), a Gemini estimate starts
+    alongside it. The first acceptable answer wins and the other request is
+    cancelled; nothing is awaited past `budget` seconds. Upstream calls are
+    shared through single-flight, so cancelling here only drops our interest.
+
+    Args:
+        card_name: Identified card name
+        set_name: Identified set, if any
+        hedge_delay: Seconds before the speculative Gemini estimate starts
+        budget: Seconds the whole pricing stage may take
+
+    Returns:
+        (card_data, ai_estimate): the API data if the lookup finished in time
+        (it may carry details without a price), and the Gemini estimate when
+        that is the price to use
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    price_hedge_counts["lookups"] += 1
+
+    api_task = None
+    if pokemon_api.api_key:
+        api_task = asyncio.create_task(_market_lookup(card_name, set_name))
+    else:
+        print("   ⚠️  Pokemon API key not configured")
+    ai_task = None
+    handled = set()
+    card_data = None
+
+    try:
+        while True:
+            elapsed = loop.time() - started
+            api_pending = api_task is not None and not api_task.done()
+            if ai_task is None and (not api_pending or elapsed >= hedge_delay):
+                if api_pending:
+                    price_hedge_counts["hedged"] += 1
+                    print(f"   ⏱️  No API price after {hedge_delay:.1f}s - requesting an AI estimate in parallel")
+                else:
+                    print(f"\n   🤖 Generating AI price estimate...")
+                ai_task = asyncio.create_task(estimate_price_with_ai(card_name, set_name))
+
+            pending = [task for task in (api_task, ai_task) if task is not None and not task.done()]
+            if not pending and all(task in handled for task in (api_task, ai_task) if task is not None):
+                # Neither source produced a price
+                return card_data, None
+            if pending:
+                timeout = budget - elapsed
+                if timeout <= 0:
+                    price_hedge_counts["budget_exceeded"] += 1
+                    print(f"   ⌛ Pricing budget of {budget:.1f}s used up")
+                    return card_data, None
+                if ai_task is None:
+                    timeout = min(timeout, hedge_delay - elapsed)
+                await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            # The API answer is preferred when both are ready
+            for task in (api_task, ai_task):
+                if task is None or not task.done() or task in handled:
+                    continue
+                handled.add(task)
+                if task is api_task:
+                    card_data = task.result()
+                    if card_data and _has_market_price(card_data):
+                        price_hedge_counts["api_wins"] += 1
+                        return card_data, None
+                else:
+                    try:
+                        estimate = task.result()
+                    except Exception as e:
+                        print(f"   ❌ Unable to generate price estimate: {e}")
+                        continue
+                    price_hedge_counts["ai_wins"] += 1
+                    print(f"   💭 AI Estimate: {estimate}")
+                    return card_data, estimate
+    finally:
+        for task in (api_task, ai_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def pricing_stats() -> Dict[str, Any]:
+    """Hedged pricing settings and how often each source won"""
+    return {"hedge_delay": PRICE_HEDGE_DELAY, "budget": PRICE_BUDGET, **price_hedge_counts}
+
+
+async def _identify_card(contents: bytes) -> Dict[str, Any]:
+    """
+    Identify and grade a card image with Gemini
+
+    Args:
+        contents: Raw image bytes
+
+    Returns:
+        Identification and grading fields of a CardAnalysisResponse (no price)
+    """
+    # Downscale/re-encode off the event loop so Gemini gets a small payload
+    prepared = await asyncio.to_thread(preprocess_image, contents)
+    print(
+        f"🗜️  Preprocessed: {prepared['original_size'][0]}x{prepared['original_size'][1]} "
+        f"→ {prepared['processed_size'][0]}x{prepared['processed_size'][1]}, "
+        f"{prepared['original_bytes'] / 1024:.0f} KB → {prepared['processed_bytes'] / 1024:.0f} KB"
+        + (" (cropped to card)" if prepared["cropped"] else "")
+    )
+    image = {"mime_type": prepared["mime_type"], "data": prepared["data"]}
+
+    # Step 1: Use Gemini to identify the card and grade it
+    print("\n🤖 STEP 1: Calling Gemini AI for card identification and grading...")
+    prompt = """
+    You are a Pokemon card expert and professional grader. Analyze this Pokemon card image and provide:
+    1. The exact card name (just the Pokemon name and card variant, e.g. "Charizard ex" or "Pikachu VMAX")
+    2. The set name (e.g. "Base Set", "Temporal Forces", "Crown Zenith")
+    3. Card number if visible (e.g. "4/102" or "123")
+    4. Brief details about the card (set, rarity, condition assessment)
+    5. Professional grading assessment for each category (score 1-10):
+       - Centering: Score and comment about card centering
+       - Corners: Score and description of corner wear/condition
+       - Edges: Score and description of edge condition
+       - Surface: Score and description of surface flaws/condition
+    5. Authenticity assessment:
+       - is_authentic: true/false if the card appears authentic
+       - authenticity_confidence: number 0-100 confidence
+       - authenticity_notes: brief reasons and any counterfeit flags (e.g., wrong font, misaligned borders, holo pattern issues)
+
+    Format your response as JSON:
+    {
+        "card_name": "Card Name Here",
+        "set_name": "Set Name Here",
+        "card_number": "123/456",
+        "details": "Brief description including set, rarity, and condition",
+        "centering": {
+            "score": 9.5,
+            "description": "Slightly bottom-heavy"
+        },
+        "corners": {
+            "score": 9.0,
+            "description": "Two tiny dots of whitening on back corners"
+        },
+        "edges": {
+            "score": 9.5,
+            "description": "Near perfect"
+        },
+        "surface": {
+            "score": 8.0,
+            "description": "One visible surface scratch on holographic area"
+        },
+        "is_authentic": true,
+        "authenticity_confidence": 92.5,
+        "authenticity_notes": "Holo pattern matches, font and border alignment correct"
+    }
+    """
+
+    # Call Gemini API
+    response = await gemini.generate_content(
+        [prompt, image],
+        generation_config={
+            "temperature": 0.2,
+            "response_mime_type": "application/json"
+        }
+    )
+
+    # Parse response
+    result = json.loads(response.text)
+
+    print("\n✅ Gemini AI Response:")
+    print(f"   Card Name: {result.get('card_name', 'Unknown')}")
+    print(f"   Set: {result.get('set_name', 'Unknown')}")
+    print(f"   Card Number: {result.get('card_number', 'Unknown')}")
+    if result.get('centering'):
+        print(
+            f"   Centering: {result['centering'].get('score', 'N/A')}/10")
+    if result.get('corners'):
+        print(f"   Corners: {result['corners'].get('score', 'N/A')}/10")
+    if result.get('edges'):
+        print(f"   Edges: {result['edges'].get('score', 'N/A')}/10")
+    if result.get('surface'):
+        print(f"   Surface: {result['surface'].get('score', 'N/A')}/10")
+
+    # Calculate overall grade
+    grades = []
+    if result.get("centering", {}).get("score"):
+        grades.append(result["centering"]["score"])
+    if result.get("corners", {}).get("score"):
+        grades.append(result["corners"]["score"])
+    if result.get("edges", {}).get("score"):
+        grades.append(result["edges"]["score"])
+    if result.get("surface", {}).get("score"):
+        grades.append(result["surface"]["score"])
+
+    overall_grade = round(sum(grades) / len(grades), 1) if grades else None
+    if overall_grade:
+        print(f"   Overall Grade: {overall_grade}/10")
+
+    return {
+        "card_name": result.get("card_name", "Unknown Card"),
+        "set_name": result.get("set_name"),
+        "card_number": result.get("card_number"),
+        "details": result.get("details", "No details available"),
+        "centering": result.get("centering") or None,
+        "corners": result.get("corners") or None,
+        "edges": result.get("edges") or None,
+        "surface": result.get("surface") or None,
+        "overall_grade": overall_grade,
+        "is_authentic": result.get("is_authentic"),
+        "authenticity_confidence": result.get("authenticity_confidence"),
+        "authenticity_notes": result.get("authenticity_notes"),
+    }
+
+
+async def _price_card(identification: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve the current price of an identified card
+
+    Args:
+        identification: Output of _identify_card (or its cached copy)
+
+    Returns:
+        Pricing fields of a CardAnalysisResponse, plus set/number/details
+        corrected from the Pokemon API match
+    """
+    # Step 2: Fetch real market prices from Pokemon Price Tracker API
+    card_name = identification["card_name"]
+    set_name = identification.get("set_name")
+    details = identification.get("details") or "No details available"
+
+    print(f"\n💰 STEP 2: Fetching real market prices for '{card_name}'...")
+
+    market_price = None
+    price_source = "ai"
+    estimated_price = "Unable to determine"
+    tcg_player_id = None
+    actual_set_name = set_name
+    card_number = identification.get("card_number")
+    rarity = None
+    psa_10_price = None
+    psa_9_price = None
+    psa_8_price = None
+
+    # Race the Pokemon API against a speculative AI estimate within the pricing budget
+    card_data, ai_estimate = await resolve_price(card_name, set_name)
+
+    if card_data:
+        print(f"\n   ✅ Card found in Pokemon API database!")
+        # Extract price information
+        price_info = pokemon_api.format_price_data(card_data)
+        psa_info = pokemon_api.extract_psa_prices(card_data)
+
+        print(f"\n   📊 Market Data:")
+        if price_info["market_price"]:
+            market_price = price_info["market_price"]
+            estimated_price = f"${market_price:.2f}"
+            price_source = "api"
+            print(f"      💵 Market Price: ${market_price:.2f}")
+        elif price_info["price_range"]:
+            estimated_price = price_info["price_range"]
+            price_source = "api"
+            print(f"      💵 Price Range: {estimated_price}")
+
+        # Extract additional card details
+        tcg_player_id = card_data.get("tcgplayerId")
+        actual_set_name = card_data.get("set", set_name)
+        card_number = card_data.get("number", card_number)
+        rarity = card_data.get("rarity")
+
+        if actual_set_name:
+            print(f"      📦 Set: {actual_set_name}")
+        if card_number:
+            print(f"      #️⃣  Number: {card_number}")
+        if rarity:
+            print(f"      ⭐ Rarity: {rarity}")
+        if tcg_player_id:
+            print(f"      🆔 TCGPlayer ID: {tcg_player_id}")
+
+        # PSA prices
+        psa_10_price = psa_info.get("psa_10")
+        psa_9_price = psa_info.get("psa_9")
+        psa_8_price = psa_info.get("psa_8")
+
+        if psa_10_price or psa_9_price or psa_8_price:
+            print(f"\n   🏆 PSA Graded Values:")
+            if psa_10_price:
+                print(f"      PSA 10: ${psa_10_price:.2f}")
+            if psa_9_price:
+                print(f"      PSA 9: ${psa_9_price:.2f}")
+            if psa_8_price:
+                print(f"      PSA 8: ${psa_8_price:.2f}")
+
+        # Update details with real market info
+        if rarity:
+            details = f"{actual_set_name} - {rarity} - {details}"
+
+    # If we couldn't get real pricing, use the AI estimate
+    if price_source == "ai" and estimated_price == "Unable to determine":
+        estimated_price = ai_estimate or "Price unavailable"
+
+
+    return {
+        "estimated_price": estimated_price,
+        "market_price": market_price,
+        "price_source": price_source,
+        "tcg_player_id": tcg_player_id,
+        "set_name": actual_set_name,
+        "card_number": card_number,
+        "rarity": rarity,
+        "psa_10_price": psa_10_price,
+        "psa_9_price": psa_9_price,
+        "psa_8_price": psa_8_price,
+        "details": details,
+    }
+
+
+async def analyze_image(
+    contents: bytes,
+    filename: Optional[str],
+    db: AsyncSession,
+    force: bool = False,
+    on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None
+) -> Tuple[CardAnalysisResponse, Optional[str]]:
+    """
+    Run the full analysis pipeline for one uploaded card image
+
+    Args:
+        contents: Raw image bytes
+        filename: Original upload filename (for logging)
+        db: Database session used by the re-upload cache
+        force: Re-analyze even if a near-identical image was seen before
+        on_progress: Called as on_progress(stage, partial_result) when a stage
+            finishes: "identified" after Gemini grading (or a cache hit), "market" once the
+            price is resolved
+
+    Returns:
+        (analysis, cache_status) where cache_status is "hit", "miss" or None
+        when the re-upload cache was not used
+    """
+    print("\n" + "="*80)
+    print("🎴 NEW CARD ANALYSIS REQUEST")
+    print("="*80)
+
+    try:
+        print(f"📸 Image received: {filename}")
+
+        # Step 0: Fingerprint the upload so a re-scan can skip Gemini
+        image_hash = None
+        if ANALYSIS_CACHE_ENABLED:
+            try:
+                image_hash = await asyncio.to_thread(dhash, contents)
+            except Exception as hash_error:
+                print(f"   ⚠️  Could not fingerprint image: {hash_error}")
+
+        # Only identification and grading are reused; prices move, so they're resolved every time
+        identification = None
+        cache_status = None
+        if image_hash is not None and not force:
+            cached = await db.run_sync(find_cached_analysis, image_hash)
+            # Entries written before prices were left out of the cache carry a stale price
+            if cached and "estimated_price" not in cached:
+                print("♻️  Near-identical image analyzed before - reusing its identification and grading")
+                identification = cached
+                cache_status = "hit"
+
+        if identification is None:
+            identification = await _identify_card(contents)
+
+        if on_progress:
+            on_progress("identified", identification)
+
+        pricing = await _price_card(identification)
+
+        if on_progress:
+            on_progress("market", {key: value for key, value in pricing.items() if key != "details"})
+
+        print(f"\n" + "="*80)
+        print(f"📋 FINAL ANALYSIS SUMMARY")
+        print("="*80)
+        print(f"   Card: {identification['card_name']}")
+        print(f"   Price: {pricing['estimated_price']} (Source: {pricing['price_source'].upper()})")
+        if identification.get("overall_grade"):
+            print(f"   Grade: {identification['overall_grade']}/10")
+        print("="*80 + "\n")
+
+        analysis = CardAnalysisResponse(**{**identification, **pricing})
+
+        if image_hash is not None and cache_status is None:
+            cache_status = "miss"
+            try:
+                await db.run_sync(store_analysis, image_hash, identification)
+            except Exception as cache_error:
+                # The analysis is already paid for; losing the cache entry is harmless
+                await db.rollback()
+                print(f"   ⚠️  Could not cache analysis: {cache_error}")
+
+        return analysis, cache_status
+
+    except json.JSONDecodeError as e:
+        # Fallback if JSON parsing fails
+        print(f"\n❌ ERROR: Failed to parse Gemini AI response")
+        print(f"   Details: {str(e)}")
+        print("="*80 + "\n")
+        return CardAnalysisResponse(
+            card_name="Analysis Error",
+            estimated_price="Unable to determine",
+            details=e.doc or "Error analyzing card",
+            price_source="error"
+        ), None
+    except Exception as e:
+        print(f"\n❌ CRITICAL ERROR during card analysis")
+        print(f"   Error: {str(e)}")
+        print("="*80 + "\n")
+        raise
@@ -0,0 +1,319 @@
+"""
+Durable queue for asynchronous card analysis
+
+`POST /analyze-card?async=true` stores the upload in the image store, records
+an AnalysisJob row and returns its id straight away instead of holding the
+connection open for the whole Gemini + Pokemon API pipeline. A small worker
+pool runs queued jobs, retrying failures with exponential backoff, and
+`GET /jobs/{job_id}?wait=` long-polls for the result.
+
+The table is the source of truth: jobs that were queued or running when the
+process stopped are queued again on the next startup. This assumes one API
+process owns the queue.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import delete, select, update
+
+from analysis import analyze_image
+from database import AsyncSessionLocal
+from image_store import delete_image, load_image, save_image
+from image_variants import delete_variants
+from models import AnalysisJob, PokemonCard
+
+# Jobs analyzed at once (Gemini concurrency is still capped by GEMINI_MAX_CONCURRENCY)
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# Attempts per job before it is marked failed
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+# Seconds before the first retry; doubles on every further attempt
+ANALYSIS_JOB_RETRY_DELAY = float(os.getenv("ANALYSIS_JOB_RETRY_DELAY", "5"))
+# Longest a `GET /jobs/{job_id}?wait=` request is held open
+ANALYSIS_JOB_MAX_WAIT = float(os.getenv("ANALYSIS_JOB_MAX_WAIT", "30"))
+# Finished jobs (and their images, unless a card uses them) are deleted after this many days
+ANALYSIS_JOB_RETENTION_DAYS = float(os.getenv("ANALYSIS_JOB_RETENTION_DAYS", "7"))
+
+PENDING_STATUSES = ("queued", "running")
+# Failures that another attempt can't fix (the upload itself is unusable)
+PERMANENT_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+# How often expired jobs are pruned
+PRUNE_INTERVAL = 3600
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+async def image_in_use_by_jobs(db, image_sha256: str) -> bool:
+    """Whether a job that hasn't been pruned yet still needs this stored image"""
+    return await db.scalar(select(AnalysisJob.id).where(
+        AnalysisJob.image_sha256 == image_sha256).limit(1)) is not None
+
+
+class AnalysisJobQueue:
+    """Worker pool over the analysis_jobs table"""
+
+    def __init__(
+        self,
+        workers: int = ANALYSIS_JOB_WORKERS,
+        max_attempts: int = ANALYSIS_JOB_MAX_ATTEMPTS,
+        retry_delay: float = ANALYSIS_JOB_RETRY_DELAY
+    ):
+        self.workers = workers
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retry_handles: Dict[str, asyncio.TimerHandle] = {}
+        # Set when a job reaches "done" or "failed"; long-polls wait on it
+        self._finished: Dict[str, asyncio.Event] = {}
+
+    async def start(self):
+        """Start the workers (called on app startup) and requeue jobs left over from the last run"""
+        self._queue = asyncio.Queue()
+        async with AsyncSessionLocal() as db:
+            # A job that was running when the process stopped gets run again
+            await db.execute(update(AnalysisJob).where(
+                AnalysisJob.status == "running").values(status="queued"))
+            await db.commit()
+            pending = (await db.execute(select(AnalysisJob.id, AnalysisJob.next_attempt_at).where(
+                AnalysisJob.status == "queued").order_by(AnalysisJob.created_at))).all()
+
+        now = datetime.utcnow()
+        for job_id, next_attempt_at in pending:
+            delay = (next_attempt_at.replace(tzinfo=None) - now).total_seconds() if next_attempt_at else 0
+            self._schedule(job_id, delay)
+        if pending:
+            print(f"🔁 Requeued {len(pending)} analysis job(s) from before the restart")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._prune_loop()))
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running are requeued on the next start"""
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, contents: bytes, filename: Optional[str], force: bool = False) -> AnalysisJob:
+        """
+        Persist an upload and queue it for analysis
+
+        Args:
+            contents: Raw image bytes
+            filename: Original upload filename
+            force: Re-analyze even if a near-identical image was seen before
+
+        Returns:
+            The queued job
+        """
+        if self._queue is None:
+            raise RuntimeError("Analysis job queue is not running")
+
+        image_sha256 = await asyncio.to_thread(save_image, contents)
+        job = AnalysisJob(
+            id=uuid.uuid4().hex,
+            filename=filename,
+            image_sha256=image_sha256,
+            force=force,
+            status="queued",
+            attempts=0,
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+        self._schedule(job.id)
+        return job
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[AnalysisJob]:
+        """
+        Load a job, optionally waiting up to `wait` seconds for it to finish
+
+        Returns:
+            The job, or None if it doesn't exist
+        """
+        # Taken before reading the row so a job finishing in between still wakes us
+        finished = self._finished.get(job_id)
+        job = await self._load(job_id)
+        if job is None or job.status not in PENDING_STATUSES or finished is None or wait <= 0:
+            return job
+
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=min(wait, ANALYSIS_JOB_MAX_WAIT))
+        except asyncio.TimeoutError:
+            pass
+        # Reload either way: attempts, errors and retry times change while we wait
+        return await self._load(job_id)
+
+    @staticmethod
+    async def _load(job_id: str) -> Optional[AnalysisJob]:
+        async with AsyncSessionLocal() as db:
+            return await db.get(AnalysisJob, job_id)
+
+    def _schedule(self, job_id: str, delay: float = 0):
+        self._finished.setdefault(job_id, asyncio.Event())
+        if delay <= 0:
+            self._queue.put_nowait(job_id)
+            return
+
+        def enqueue():
+            self._retry_handles.pop(job_id, None)
+            self._queue.put_nowait(job_id)
+
+        self._retry_handles[job_id] = asyncio.get_running_loop().call_later(delay, enqueue)
+
+    def _finish(self, job_id: str):
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _claim(self, job_id: str) -> Optional[AnalysisJob]:
+        """Mark a queued job running; None if it was already taken or no longer exists"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(update(AnalysisJob).where(
+                AnalysisJob.id == job_id, AnalysisJob.status == "queued"
+            ).values(
+                status="running",
+                attempts=AnalysisJob.attempts + 1,
+                started_at=datetime.utcnow(),
+            ))
+            await db.commit()
+            if result.rowcount != 1:
+                return None
+            return await db.get(AnalysisJob, job_id)
+
+    async def _set_job(self, job_id: str, **values):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(AnalysisJob).where(AnalysisJob.id == job_id).values(**values))
+            await db.commit()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = await self._claim(job_id)
+            if job is None:
+                continue
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Bookkeeping failed (e.g. database locked); the row stays "running" until restart
+                print(f"❌ Analysis job {job_id} could not be updated: {e}")
+
+    async def _run(self, job: AnalysisJob):
+        contents = await asyncio.to_thread(load_image, job.image_sha256)
+        if contents is None:
+            await self._fail(job, "Uploaded image is no longer available", retry=False)
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                analysis, cache_status = await analyze_image(contents, job.filename, db, job.force)
+        except asyncio.CancelledError:
+            raise
+        except PERMANENT_ERRORS as e:
+            error = "Upload is not a readable image" if isinstance(e, UnidentifiedImageError) else str(e)
+            await self._fail(job, error, retry=False)
+            return
+        except Exception as e:
+            await self._fail(job, str(e), retry=job.attempts < self.max_attempts)
+            return
+
+        await self._set_job(
+            job.id,
+            status="done",
+            result_json=analysis.model_dump_json(),
+            cache_status=cache_status,
+            error=None,
+            finished_at=datetime.utcnow(),
+        )
+        self._finish(job.id)
+        print(f"✅ Analysis job {job.id} done ({job.attempts} attempt(s))")
+
+    async def _fail(self, job: AnalysisJob, error: str, retry: bool):
+        if retry:
+            delay = self.retry_delay * 2 ** (job.attempts - 1)
+            await self._set_job(
+                job.id,
+                status="queued",
+                error=error,
+                next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+            )
+            self._schedule(job.id, delay)
+            print(f"⚠️  Analysis job {job.id} attempt {job.attempts} failed, retrying in {delay:.0f}s: {error}")
+            return
+
+        await self._set_job(job.id, status="failed", error=error, finished_at=datetime.utcnow())
+        self._finish(job.id)
+        print(f"❌ Analysis job {job.id} failed after {job.attempts} attempt(s): {error}")
+
+    async def _prune_loop(self):
+        while True:
+            try:
+                await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Could not prune analysis jobs: {e}")
+            await asyncio.sleep(PRUNE_INTERVAL)
+
+    async def prune(self) -> int:
+        """
+        Delete finished jobs older than the retention period, and their images if nothing else uses them
+
+        Returns:
+            Number of jobs deleted
+        """
+        if ANALYSIS_JOB_RETENTION_DAYS <= 0:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=ANALYSIS_JOB_RETENTION_DAYS)
+        async with AsyncSessionLocal() as db:
+            expired = (await db.execute(select(AnalysisJob.id, AnalysisJob.image_sha256).where(
+                AnalysisJob.status.in_(("done", "failed")),
+                AnalysisJob.finished_at < cutoff
+            ))).all()
+            if not expired:
+                return 0
+            await db.execute(delete(AnalysisJob).where(
+                AnalysisJob.id.in_([job_id for job_id, _ in expired])))
+            await db.commit()
+
+            for image_sha256 in {image_sha256 for _, image_sha256 in expired}:
+                used_by_card = await db.scalar(select(PokemonCard.id).where(
+                    PokemonCard.image_sha256 == image_sha256).limit(1))
+                if used_by_card is None and not await image_in_use_by_jobs(db, image_sha256):
+                    delete_image(image_sha256)
+                    delete_variants(image_sha256)
+
+        print(f"🧹 Pruned {len(expired)} finished analysis job(s)")
+        return len(expired)
+
+    def job_status(self, job: AnalysisJob) -> Dict[str, Any]:
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "filename": job.filename,
+            "attempts": job.attempts,
+            "cache": job.cache_status,
+            "result": json.loads(job.result_json) if job.result_json else None,
+            "error": job.error,
+            "created_at": _isoformat(job.created_at),
+            "started_at": _isoformat(job.started_at),
+            "finished_at": _isoformat(job.finished_at),
+            "next_attempt_at": _isoformat(job.next_attempt_at) if job.status == "queued" else None,
+        }
+
+
+# Singleton instance
+analysis_jobs = AnalysisJobQueue()
@@ -0,0 +1,137 @@
+"""
+Micro-benchmark: per-card cost of serializing a /cards page
+
+Compares the previous path (hand-built CardResponse per row, re-validated by
+FastAPI's response_model, then json.dumps) with card_to_dict + orjson.
+
+Usage (from backend/):
+    python benchmarks/card_serialization.py [rows]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main.py needs these at import time; nothing here touches Gemini or the database
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import orjson  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from main import CardResponse, card_to_dict  # noqa: E402
+from models import PokemonCard  # noqa: E402
+
+
+def make_cards(count: int) -> List[PokemonCard]:
+    created_at = datetime(2025, 1, 1)
+    return [
+        PokemonCard(
+            id=index,
+            card_name=f"Pikachu #{index}",
+            estimated_price="$10.00 - $15.00",
+            details="Near mint, light whitening on the back edges",
+            image_filename=f"card_{index}.jpg",
+            created_at=created_at + timedelta(minutes=index),
+            centering_score=8.5,
+            centering_comment="Slightly off-center left to right",
+            corners_score=9.0,
+            corners_description="Sharp corners",
+            edges_score=8.0,
+            edges_description="Minor whitening",
+            surface_score=9.5,
+            surface_description="Clean surface",
+            overall_grade=8.8,
+            market_price=12.5,
+            price_source="api",
+            tcg_player_id=str(100000 + index),
+            set_name="Base Set",
+            card_number="58/102",
+            rarity="Common",
+            psa_10_price=250.0,
+            psa_9_price=80.0,
+            psa_8_price=40.0,
+            is_authentic=True,
+            authenticity_confidence=0.97,
+            authenticity_notes="Print pattern matches",
+        )
+        for index in range(count)
+    ]
+
+
+def legacy_card_response(card: PokemonCard) -> CardResponse:
+    """How get_cards built each item before card_to_dict"""
+    return CardResponse(
+        id=card.id,
+        card_name=card.card_name,
+        estimated_price=card.estimated_price,
+        details=card.details,
+        image_filename=card.image_filename,
+        created_at=card.created_at.isoformat(),
+        centering_score=card.centering_score,
+        centering_comment=card.centering_comment,
+        corners_score=card.corners_score,
+        corners_description=card.corners_description,
+        edges_score=card.edges_score,
+        edges_description=card.edges_description,
+        surface_score=card.surface_score,
+        surface_description=card.surface_description,
+        overall_grade=card.overall_grade,
+        is_authentic=card.is_authentic,
+        authenticity_confidence=card.authenticity_confidence,
+        authenticity_notes=card.authenticity_notes,
+        market_price=card.market_price,
+        price_source=card.price_source,
+        tcg_player_id=card.tcg_player_id,
+        set_name=card.set_name,
+        card_number=card.card_number,
+        rarity=card.rarity,
+        psa_10_price=card.psa_10_price,
+        psa_9_price=card.psa_9_price,
+        psa_8_price=card.psa_8_price
+    )
+
+
+# FastAPI validates the endpoint's return value against response_model=List[CardResponse]
+response_adapter = TypeAdapter(List[CardResponse])
+
+
+def before(cards: List[PokemonCard]) -> bytes:
+    items = [legacy_card_response(card) for card in cards]
+    validated = response_adapter.validate_python(items, from_attributes=True)
+    return json.dumps(response_adapter.dump_python(validated, mode="json")).encode()
+
+
+def after(cards: List[PokemonCard]) -> bytes:
+    return orjson.dumps([card_to_dict(card) for card in cards])
+
+
+def measure(fn, cards: List[PokemonCard], repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(cards)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    cards = make_cards(count)
+
+    # Same payload either way
+    assert json.loads(before(cards[:10])) == json.loads(after(cards[:10]))
+
+    before_seconds = measure(before, cards)
+    after_seconds = measure(after, cards)
+    print(f"Serializing {count} cards (best of 5)")
+    print(f"  before: {before_seconds * 1000:8.1f} ms total, {before_seconds / count * 1e6:6.2f} µs/card")
+    print(f"  after:  {after_seconds * 1000:8.1f} ms total, {after_seconds / count * 1e6:6.2f} µs/card")
+    print(f"  speedup: {before_seconds / after_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
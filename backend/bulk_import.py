@@ -0,0 +1,461 @@
+"""
+Bulk collection import
+
+`POST /import` accepts a ZIP of card photos or a CSV of cards (name, set,
+number, price) and spools it to disk. Imports run in the background one at a
+time: a reader feeds items into a bounded queue and a pool of workers runs
+the same analysis / market lookup as `/analyze-card`. Finished cards are
+committed in batches (one INSERT round, one price_history INSERT, one
+portfolio delta per batch). Progress, throughput and failures are kept on the
+ImportJob row.
+"""
+import asyncio
+import csv
+import json
+import os
+import uuid
+import zipfile
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from sqlalchemy import insert
+
+from analysis import CardAnalysisResponse, analyze_image, estimate_price_with_ai
+from database import AsyncSessionLocal, SessionLocal
+from image_store import save_image, sniff_content_type
+from models import ImportJob, PokemonCard, PriceHistory
+from pokemon_api import pokemon_api
+from portfolio import apply_portfolio_delta, set_card_price
+
+IMPORT_SPOOL_DIR = Path(os.getenv("IMPORT_SPOOL_DIR", "./import_spool"))
+# Items analyzed at once within an import
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+# Cards committed per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "25"))
+# Largest upload accepted by /import, and largest image inside a ZIP (each image is read into memory)
+IMPORT_MAX_UPLOAD_BYTES = int(os.getenv("IMPORT_MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+IMPORT_MAX_MEMBER_BYTES = int(os.getenv("IMPORT_MAX_MEMBER_BYTES", str(25 * 1024 ** 2)))
+# Failures kept on the job for the status endpoint
+IMPORT_MAX_REPORTED_FAILURES = 100
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+# Accepted CSV headers for each field (case-insensitive)
+CSV_COLUMNS = {
+    "name": ("name", "card_name"),
+    "set": ("set", "set_name"),
+    "number": ("number", "card_number"),
+    "price": ("price", "estimated_price"),
+}
+
+_DONE = object()
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds IMPORT_MAX_UPLOAD_BYTES"""
+
+
+def spool_upload(source: BinaryIO, filename: Optional[str]) -> Path:
+    """
+    Copy an upload to the spool directory in chunks (blocking - run it in a thread)
+
+    Returns:
+        Path of the spooled file
+
+    Raises:
+        UploadTooLarge: if the upload exceeds IMPORT_MAX_UPLOAD_BYTES (nothing is left on disk)
+    """
+    IMPORT_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    suffix = Path(filename or "").suffix.lower()
+    path = IMPORT_SPOOL_DIR / f"{uuid.uuid4().hex}{suffix}"
+    written = 0
+    try:
+        with open(path, "wb") as spool_file:
+            while chunk := source.read(1024 * 1024):
+                written += len(chunk)
+                if written > IMPORT_MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"Upload is larger than {IMPORT_MAX_UPLOAD_BYTES} bytes")
+                spool_file.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path
+
+
+def _read_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Union[bytes, ValueError]:
+    """
+    Inflate one ZIP member, stopping after IMPORT_MAX_MEMBER_BYTES
+
+    The declared size in the ZIP header can't be trusted, so the limit is
+    applied to the bytes actually decompressed. An oversized or corrupt member
+    comes back as a ValueError, to be reported as a failed item.
+    """
+    too_large = ValueError(f"Image is larger than {IMPORT_MAX_MEMBER_BYTES} bytes uncompressed")
+    if info.file_size > IMPORT_MAX_MEMBER_BYTES:
+        return too_large
+    try:
+        with archive.open(info) as member:
+            data = member.read(IMPORT_MAX_MEMBER_BYTES + 1)
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        # e.g. a CRC mismatch from a header that understates the size
+        return ValueError(f"Corrupt ZIP member: {e}")
+    return too_large if len(data) > IMPORT_MAX_MEMBER_BYTES else data
+
+
+def detect_kind(path: Path) -> Optional[str]:
+    if zipfile.is_zipfile(path):
+        return "zip"
+    if path.suffix == ".csv":
+        return "csv"
+    return None
+
+
+def _csv_value(row: Dict[str, str], field: str) -> Optional[str]:
+    for key, value in row.items():
+        if key and key.strip().lower() in CSV_COLUMNS[field]:
+            value = (value or "").strip()
+            return value or None
+    return None
+
+
+def card_from_analysis(
+    analysis: CardAnalysisResponse,
+    image_contents: Optional[bytes] = None,
+    image_filename: Optional[str] = None
+) -> PokemonCard:
+    """Build an unsaved PokemonCard from an analysis result (and optionally its image)"""
+    card = PokemonCard(
+        card_name=analysis.card_name,
+        details=analysis.details,
+        image_filename=image_filename,
+        overall_grade=analysis.overall_grade,
+        is_authentic=analysis.is_authentic,
+        authenticity_confidence=analysis.authenticity_confidence,
+        authenticity_notes=analysis.authenticity_notes,
+        market_price=analysis.market_price,
+        price_source=analysis.price_source,
+        tcg_player_id=analysis.tcg_player_id,
+        set_name=analysis.set_name,
+        card_number=analysis.card_number,
+        rarity=analysis.rarity,
+        psa_10_price=analysis.psa_10_price,
+        psa_9_price=analysis.psa_9_price,
+        psa_8_price=analysis.psa_8_price,
+    )
+    for condition in ("centering", "corners", "edges", "surface"):
+        grading = getattr(analysis, condition)
+        if grading:
+            setattr(card, f"{condition}_score", grading.score)
+            comment_field = "centering_comment" if condition == "centering" else f"{condition}_description"
+            setattr(card, comment_field, grading.description)
+    if image_contents is not None:
+        card.image_sha256 = save_image(image_contents)
+        card.image_size = len(image_contents)
+        card.image_content_type = sniff_content_type(image_contents, image_filename)
+    set_card_price(card, analysis.estimated_price)
+    return card
+
+
+async def price_card_row(
+    name: str,
+    set_name: Optional[str],
+    number: Optional[str],
+    price: Optional[str]
+) -> CardAnalysisResponse:
+    """
+    Price a CSV row: the given price, else the Pokemon API market price, else an AI estimate
+    """
+    analysis = CardAnalysisResponse(
+        card_name=name,
+        estimated_price=price or "Price unavailable",
+        details=f"Imported from CSV{f' - {set_name}' if set_name else ''}",
+        set_name=set_name,
+        card_number=number,
+        price_source="import" if price else None,
+    )
+    if price:
+        return analysis
+
+    if pokemon_api.api_key:
+        card_data = await pokemon_api.get_card_with_psa_data(name, set_name)
+        if card_data:
+            price_info = pokemon_api.format_price_data(card_data)
+            psa_info = pokemon_api.extract_psa_prices(card_data)
+            if price_info["market_price"]:
+                analysis.estimated_price = f"${price_info['market_price']:.2f}"
+                analysis.market_price = price_info["market_price"]
+                analysis.price_source = "api"
+            elif price_info["price_range"]:
+                analysis.estimated_price = price_info["price_range"]
+                analysis.price_source = "api"
+            analysis.tcg_player_id = card_data.get("tcgplayerId")
+            analysis.set_name = card_data.get("set", set_name)
+            analysis.card_number = card_data.get("number", number)
+            analysis.rarity = card_data.get("rarity")
+            analysis.psa_10_price = psa_info.get("psa_10")
+            analysis.psa_9_price = psa_info.get("psa_9")
+            analysis.psa_8_price = psa_info.get("psa_8")
+
+    if analysis.price_source is None:
+        analysis.estimated_price = await estimate_price_with_ai(name, set_name)
+        analysis.price_source = "ai"
+    return analysis
+
+
+class ImportRun:
+    """Processes one import job: reader -> bounded queue -> worker pool -> batched commits"""
+
+    def __init__(self, job_id: int, kind: str, spool_path: Path, workers: int, batch_size: int):
+        self.job_id = job_id
+        self.kind = kind
+        self.spool_path = spool_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+        self.pending: List[PokemonCard] = []
+        self.failures: List[Dict[str, str]] = []
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.total_items: Optional[int] = None
+        self.stopped = False
+        self._flush_lock = asyncio.Lock()
+
+    def _read_items(self, loop: asyncio.AbstractEventLoop):
+        """Blocking reader thread: feeds (label, payload) items into the queue"""
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(item), loop)
+            # Wait for queue space, but give up if the import is being cancelled
+            while True:
+                try:
+                    return future.result(timeout=1)
+                except TimeoutError:
+                    if self.stopped:
+                        future.cancel()
+                        raise RuntimeError("Import cancelled")
+
+        if self.kind == "zip":
+            with zipfile.ZipFile(self.spool_path) as archive:
+                members = [
+                    info for info in archive.infolist()
+                    if not info.is_dir()
+                    and Path(info.filename).suffix.lower() in IMAGE_EXTENSIONS
+                    and not Path(info.filename).name.startswith(".")
+                    and "__MACOSX" not in info.filename
+                ]
+                self.total_items = len(members)
+                for info in members:
+                    put((info.filename, _read_member(archive, info)))
+        else:
+            with open(self.spool_path, newline="", encoding="utf-8-sig") as csv_file:
+                self.total_items = max(0, sum(1 for _ in csv_file) - 1)
+                csv_file.seek(0)
+                for line_number, row in enumerate(csv.DictReader(csv_file), start=2):
+                    put((f"line {line_number}", row))
+
+    async def _process(self, label: str, payload: Any) -> PokemonCard:
+        if isinstance(payload, Exception):
+            # Rejected by the reader
+            raise payload
+        if self.kind == "zip":
+            async with AsyncSessionLocal() as db:
+                analysis, _ = await analyze_image(payload, label, db)
+            if analysis.price_source == "error":
+                raise ValueError("Could not parse the analysis of this image")
+            return await asyncio.to_thread(card_from_analysis, analysis, payload, Path(label).name)
+
+        name = _csv_value(payload, "name")
+        if not name:
+            raise ValueError("Missing card name")
+        analysis = await price_card_row(
+            name,
+            _csv_value(payload, "set"),
+            _csv_value(payload, "number"),
+            _csv_value(payload, "price"),
+        )
+        return card_from_analysis(analysis)
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            if item is _DONE:
+                return
+            label, payload = item
+            try:
+                card = await self._process(label, payload)
+                self.pending.append(card)
+                self.succeeded += 1
+            except Exception as e:
+                self.failed += 1
+                if len(self.failures) < IMPORT_MAX_REPORTED_FAILURES:
+                    self.failures.append({"item": label, "error": str(e)})
+            self.processed += 1
+            if len(self.pending) >= self.batch_size:
+                await self._flush()
+
+    async def _flush(self):
+        """Commit pending cards, their first price history entries and progress in one transaction"""
+        async with self._flush_lock:
+            cards, self.pending = self.pending, []
+            await asyncio.to_thread(self._commit, cards)
+
+    def _commit(self, cards: List[PokemonCard]):
+        db = SessionLocal()
+        try:
+            if cards:
+                db.add_all(cards)
+                db.flush()
+                db.execute(insert(PriceHistory), [
+                    {"card_id": card.id, "price": card.price_mid or 0.0, "price_display": card.estimated_price}
+                    for card in cards
+                ])
+                apply_portfolio_delta(db, sum(card.price_mid or 0.0 for card in cards), card_delta=len(cards))
+            job = db.get(ImportJob, self.job_id)
+            job.total_items = self.total_items
+            job.processed = self.processed
+            job.succeeded = self.succeeded
+            job.failed = self.failed
+            job.failures_json = json.dumps(self.failures)
+            db.commit()
+        finally:
+            db.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            await asyncio.to_thread(self._read_items, loop)
+            for _ in workers:
+                await self.queue.put(_DONE)
+            await asyncio.gather(*workers)
+        except BaseException:
+            # Unreadable upload or shutdown: stop the reader thread and the workers
+            self.stopped = True
+            for worker in workers:
+                worker.cancel()
+            raise
+        finally:
+            # Keep whatever finished before a failure
+            await asyncio.shield(self._flush())
+
+
+class ImportManager:
+    """Runs queued import jobs one after another in the background"""
+
+    def __init__(self, workers: int = IMPORT_WORKERS, batch_size: int = IMPORT_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._active: Dict[int, ImportRun] = {}
+
+    def start(self):
+        """Start the import loop (called on app startup); imports cut off by a restart are marked failed"""
+        db = SessionLocal()
+        try:
+            interrupted = db.query(ImportJob).filter(ImportJob.status.in_(("queued", "running"))).all()
+            for job in interrupted:
+                job.status = "failed"
+                job.error = "Interrupted by a server restart"
+                job.finished_at = datetime.utcnow()
+                self._remove_spool(job.spool_path)
+            db.commit()
+        finally:
+            db.close()
+
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, job_id: int):
+        if self._queue is None:
+            raise RuntimeError("Import manager is not running")
+        self._queue.put_nowait(job_id)
+
+    @staticmethod
+    def _remove_spool(spool_path: Optional[str]):
+        if spool_path:
+            try:
+                os.remove(spool_path)
+            except FileNotFoundError:
+                pass
+
+    def _set_job(self, job_id: int, **values) -> ImportJob:
+        """Update a job row (blocking - run it in a thread)"""
+        db = SessionLocal()
+        try:
+            job = db.get(ImportJob, job_id)
+            for name, value in values.items():
+                setattr(job, name, value)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    async def _loop(self):
+        while True:
+            job_id = await self._queue.get()
+            job = await asyncio.to_thread(self._set_job, job_id, status="running", started_at=datetime.utcnow())
+            run = ImportRun(job_id, job.kind, Path(job.spool_path), self.workers, self.batch_size)
+            self._active[job_id] = run
+            print(f"📥 Import #{job_id} started ({job.kind}: {job.filename})")
+            try:
+                await run.run()
+                await asyncio.to_thread(self._set_job, job_id, status="done", finished_at=datetime.utcnow())
+                print(f"✅ Import #{job_id} done: {run.succeeded} imported, {run.failed} failed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.to_thread(
+                    self._set_job, job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+                print(f"❌ Import #{job_id} failed: {e}")
+            finally:
+                self._active.pop(job_id, None)
+                self._remove_spool(job.spool_path)
+
+    def job_status(self, job: ImportJob) -> Dict[str, Any]:
+        run = self._active.get(job.id)
+        # Live counters for the running import; committed ones otherwise
+        processed = run.processed if run else job.processed
+        succeeded = run.succeeded if run else job.succeeded
+        failed = run.failed if run else job.failed
+        total_items = run.total_items if run else job.total_items
+        failures = run.failures if run else json.loads(job.failures_json or "[]")
+
+        elapsed = None
+        if job.started_at:
+            end = job.finished_at or datetime.utcnow()
+            elapsed = max(0.0, (end.replace(tzinfo=None) - job.started_at.replace(tzinfo=None)).total_seconds())
+
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "filename": job.filename,
+            "status": job.status,
+            "total_items": total_items,
+            "processed": processed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "progress": round(processed / total_items, 4) if total_items else None,
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "items_per_second": round(processed / elapsed, 3) if elapsed else None,
+            "failures": failures,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        }
+
+
+# Singleton instance
+import_manager = ImportManager()
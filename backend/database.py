@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
@@ -7,17 +9,149 @@ load_dotenv()
 
 # Database URL - using SQLite for simplicity, can be changed to PostgreSQL for production
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pokewealth.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async drivers used by the request path (the sync engine serves migrations and background jobs)
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+# SQLite storage profile, applied to every new connection. WAL lets readers
+# keep reading while a write commits; NORMAL sync is durable in WAL mode except
+# for the last transactions on power loss.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Bytes of the database file memory-mapped for reads
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Page cache per connection; negative values are KiB (SQLite convention)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+# Milliseconds a writer waits for a lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+
+# Connection pool (PostgreSQL and other server databases)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Seconds after which pooled connections are replaced (-1 keeps them forever)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "cache_size": SQLITE_CACHE_SIZE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT,
+    "temp_store": SQLITE_TEMP_STORE,
+}
+# PRAGMAs that read back as numbers, mapped to the names used to set them
+_PRAGMA_NAMES = {
+    "synchronous": ["OFF", "NORMAL", "FULL", "EXTRA"],
+    "temp_store": ["DEFAULT", "FILE", "MEMORY"],
+}
+
+
+def async_database_url(url: str) -> str:
+    """Same database as `url`, through the async driver for its dialect"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
 
-def get_db():
-    db = SessionLocal()
+
+def _engine_options() -> dict:
+    if IS_SQLITE:
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
     try:
-        yield db
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
     finally:
-        db.close()
+        cursor.close()
+
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_engine_options()
+)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options())
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes can't be lazily reloaded after an await
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
 
 def create_tables():
     from models import Base
     Base.metadata.create_all(bind=engine)
+    run_migrations()
+
+
+def run_migrations():
+    """Apply pending Alembic migrations (upgrades databases created by older versions)"""
+    from alembic import command
+    from alembic.config import Config
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(backend_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(backend_dir, "migrations"))
+    config.set_main_option("prepend_sys_path", backend_dir)
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+
+
+def storage_settings() -> dict:
+    """Effective storage settings, read back from the database where possible"""
+    if not IS_SQLITE:
+        return {
+            "dialect": engine.dialect.name,
+            "pool_size": engine.pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+
+    # Read back what SQLite actually applied (e.g. WAL is unavailable for :memory:)
+    settings = {"dialect": "sqlite"}
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        for name in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}")
+            row = cursor.fetchone()
+            value = row[0] if row else None
+            if name in _PRAGMA_NAMES and isinstance(value, int):
+                value = _PRAGMA_NAMES[name][value]
+            settings[name] = value
+        cursor.close()
+    finally:
+        raw_connection.close()
+    return settings
+
+
+def log_storage_settings():
+    settings = storage_settings()
+    print("🗄️  Storage: " + ", ".join(f"{name}={value}" for name, value in settings.items()))
@@ -0,0 +1,136 @@
+"""
+Perceptual-hash index of analyzed card images
+
+Re-uploads of the same card produce near-identical difference hashes (dHash),
+so a previous identification and grading can be reused without calling
+Gemini again. Prices are not stored; they are resolved on every upload.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from PIL import Image, ImageOps
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from models import AnalysisFingerprint, FingerprintBand
+
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Max Hamming distance (out of 64 bits) for two images to count as the same card
+ANALYSIS_CACHE_THRESHOLD = int(os.getenv("ANALYSIS_CACHE_THRESHOLD", "3"))
+# Days a stored identification and grading is reused; 0 keeps entries forever
+ANALYSIS_CACHE_MAX_AGE_DAYS = float(os.getenv("ANALYSIS_CACHE_MAX_AGE_DAYS", "7"))
+
+HASH_SIZE = 8
+BAND_COUNT = 8
+BAND_BITS = (HASH_SIZE * HASH_SIZE) // BAND_COUNT
+# Any hash within BAND_COUNT - 1 bits shares at least one exact band (pigeonhole),
+# so the band index finds every match up to this distance
+MAX_THRESHOLD = BAND_COUNT - 1
+
+
+def dhash(contents: bytes, hash_size: int = HASH_SIZE) -> int:
+    """
+    Compute a difference hash of an image
+
+    Args:
+        contents: Raw image bytes
+        hash_size: Hash is hash_size * hash_size bits
+
+    Returns:
+        Unsigned integer hash
+    """
+    image = Image.open(BytesIO(contents))
+    # Let the JPEG decoder downscale while decoding instead of inflating every pixel
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    # A phone photo's orientation lives in EXIF; hash what the user actually sees
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(image.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(value: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (band * BAND_BITS)) & mask for band in range(BAND_COUNT)]
+
+
+def find_cached_analysis(
+    db: Session,
+    image_hash: int,
+    threshold: int = ANALYSIS_CACHE_THRESHOLD
+) -> Optional[Dict[str, Any]]:
+    """
+    Find the stored analysis of the closest previously seen image
+
+    Args:
+        db: Database session
+        image_hash: dHash of the new upload
+        threshold: Max Hamming distance to accept (capped at MAX_THRESHOLD)
+
+    Returns:
+        The stored identification and grading fields, or None if nothing is close enough
+    """
+    threshold = min(threshold, MAX_THRESHOLD)
+    if threshold < 0:
+        return None
+
+    band_filters = [
+        and_(FingerprintBand.band == band, FingerprintBand.value == value)
+        for band, value in enumerate(_bands(image_hash))
+    ]
+    candidate_ids = db.query(FingerprintBand.fingerprint_id).filter(or_(*band_filters)).distinct()
+    query = db.query(AnalysisFingerprint.id, AnalysisFingerprint.image_hash).filter(
+        AnalysisFingerprint.id.in_(candidate_ids))
+    if ANALYSIS_CACHE_MAX_AGE_DAYS > 0:
+        query = query.filter(AnalysisFingerprint.created_at >= datetime.utcnow() - timedelta(days=ANALYSIS_CACHE_MAX_AGE_DAYS))
+    candidates = query.order_by(AnalysisFingerprint.id.desc()).all()
+
+    # Closest match wins; on ties the most recent analysis is preferred
+    best_id, best_distance = None, threshold + 1
+    for fingerprint_id, stored_hash in candidates:
+        distance = hamming_distance(image_hash, _to_unsigned(stored_hash))
+        if distance < best_distance:
+            best_id, best_distance = fingerprint_id, distance
+
+    if best_id is None:
+        return None
+
+    fingerprint = db.query(AnalysisFingerprint).filter(AnalysisFingerprint.id == best_id).first()
+    return json.loads(fingerprint.analysis_json)
+
+
+def store_analysis(db: Session, image_hash: int, analysis: Dict[str, Any]) -> AnalysisFingerprint:
+    """Index an identification and grading result under the image's perceptual hash"""
+    fingerprint = AnalysisFingerprint(
+        image_hash=_to_signed(image_hash),
+        analysis_json=json.dumps(analysis),
+        bands=[
+            FingerprintBand(band=band, value=value)
+            for band, value in enumerate(_bands(image_hash))
+        ]
+    )
+    db.add(fingerprint)
+    db.commit()
+    return fingerprint
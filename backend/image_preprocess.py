@@ -0,0 +1,150 @@
+"""
+Image preprocessing before Gemini upload
+
+Phone photos are often 4000x3000 and several MB. Gemini does not need that much
+resolution to identify and grade a card, so uploads are decoded at reduced size,
+oriented, optionally cropped to the card and re-encoded as a compact JPEG.
+"""
+import math
+import os
+import threading
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageOps
+
+# Longest edge (pixels) of the image sent to Gemini
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+# JPEG quality used when re-encoding
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Crop away the background around the card before downscaling
+IMAGE_CROP_TO_CARD = os.getenv("IMAGE_CROP_TO_CARD", "false").lower() in ("1", "true", "yes")
+
+# Cumulative counters for /debug/inference (updated from worker threads)
+_stats_lock = threading.Lock()
+_stats = {
+    "images": 0,
+    "cropped": 0,
+    "original_bytes": 0,
+    "processed_bytes": 0,
+}
+
+
+def _find_card_bounds(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Estimate the card's bounding box by separating it from a uniform background
+
+    Returns:
+        (left, upper, right, lower) in image coordinates, or None if no clear card edge was found
+    """
+    probe = image.convert("L")
+    probe.thumbnail((256, 256))
+    width, height = probe.size
+
+    # Use the median of the border pixels as the background colour
+    border = (
+        [probe.getpixel((x, 0)) for x in range(width)]
+        + [probe.getpixel((x, height - 1)) for x in range(width)]
+        + [probe.getpixel((0, y)) for y in range(height)]
+        + [probe.getpixel((width - 1, y)) for y in range(height)]
+    )
+    background = sorted(border)[len(border) // 2]
+
+    diff = ImageChops.difference(probe, Image.new("L", probe.size, background))
+    mask = diff.point(lambda value: 255 if value > 40 else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return None
+
+    left, upper, right, lower = bbox
+    area_ratio = ((right - left) * (lower - upper)) / float(width * height)
+    # Ignore boxes that are basically the whole frame or too small to be the card
+    if area_ratio > 0.95 or area_ratio < 0.2:
+        return None
+
+    scale_x = image.width / float(width)
+    scale_y = image.height / float(height)
+    return (
+        int(left * scale_x),
+        int(upper * scale_y),
+        min(image.width, int(right * scale_x) + 1),
+        min(image.height, int(lower * scale_y) + 1),
+    )
+
+
+def preprocess_image(
+    contents: bytes,
+    max_edge: int = IMAGE_MAX_EDGE,
+    quality: int = IMAGE_JPEG_QUALITY,
+    crop_to_card: bool = IMAGE_CROP_TO_CARD
+) -> Dict[str, Any]:
+    """
+    Shrink an uploaded card photo for model input
+
+    Blocking (CPU-bound) - call it with asyncio.to_thread from async code.
+
+    Args:
+        contents: Raw uploaded image bytes
+        max_edge: Longest edge of the output image
+        quality: JPEG quality of the output image
+        crop_to_card: Crop to the detected card bounds first
+
+    Returns:
+        Dictionary with the Gemini blob ("mime_type", "data") plus size/byte-savings info
+    """
+    image = Image.open(BytesIO(contents))
+    original_size = image.size
+
+    # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale directly, which is far
+    # cheaper than decoding the full image and resizing it afterwards. Draft
+    # keeps both sides at least the requested size, so ask for the image's own
+    # aspect ratio scaled to max_edge. Cropping needs the full resolution.
+    scale = max_edge / max(original_size)
+    if scale < 1 and not crop_to_card:
+        image.draft("RGB", (math.ceil(original_size[0] * scale), math.ceil(original_size[1] * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    cropped = False
+    if crop_to_card:
+        bounds = _find_card_bounds(image)
+        if bounds:
+            image = image.crop(bounds)
+            cropped = True
+
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    data = output.getvalue()
+
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["cropped"] += int(cropped)
+        _stats["original_bytes"] += len(contents)
+        _stats["processed_bytes"] += len(data)
+
+    return {
+        "mime_type": "image/jpeg",
+        "data": data,
+        "original_size": original_size,
+        "processed_size": image.size,
+        "original_bytes": len(contents),
+        "processed_bytes": len(data),
+        "cropped": cropped,
+    }
+
+
+def preprocess_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    saved = stats["original_bytes"] - stats["processed_bytes"]
+    return {
+        "max_edge": IMAGE_MAX_EDGE,
+        "jpeg_quality": IMAGE_JPEG_QUALITY,
+        "crop_to_card": IMAGE_CROP_TO_CARD,
+        **stats,
+        "bytes_saved": saved,
+        "savings_ratio": round(saved / stats["original_bytes"], 4) if stats["original_bytes"] else 0.0,
+    }
@@ -0,0 +1,93 @@
+"""
+Content-addressed on-disk store for card images
+
+Images are written once under their SHA-256 digest, so identical uploads share
+one file and card rows only keep the digest. Files are served straight from
+disk with FileResponse instead of being copied out of the database.
+"""
+import hashlib
+import mimetypes
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Union
+
+from dotenv import load_dotenv
+from PIL import Image
+
+load_dotenv()
+
+IMAGE_STORE_DIR = Path(os.getenv("IMAGE_STORE_DIR", "./image_store"))
+
+
+def image_path(sha256: str) -> Path:
+    """Path of a stored image, fanned out by digest prefix to keep directories small"""
+    return IMAGE_STORE_DIR / sha256[:2] / sha256[2:4] / sha256
+
+
+def save_image(contents: bytes) -> str:
+    """
+    Store image bytes, deduplicating identical content
+
+    Args:
+        contents: Raw image bytes
+
+    Returns:
+        Hex SHA-256 digest identifying the stored image
+    """
+    sha256 = hashlib.sha256(contents).hexdigest()
+    path = image_path(sha256)
+    if path.exists():
+        return sha256
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file and rename so readers never see a partial image
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(contents)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256
+
+
+def sniff_content_type(source: Union[bytes, Path], filename: Optional[str] = None) -> str:
+    """
+    Detect an image's MIME type from its bytes (only the header is read)
+
+    Args:
+        source: Raw image bytes or a path to the image file
+        filename: Original filename, used only if the bytes aren't a recognised image
+
+    Returns:
+        MIME type such as "image/jpeg"
+    """
+    try:
+        with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+            content_type = Image.MIME.get(image.format)
+        if content_type:
+            return content_type
+    except Exception:
+        pass
+
+    guessed, _ = mimetypes.guess_type(filename or "")
+    return guessed or "application/octet-stream"
+
+
+def load_image(sha256: str) -> Optional[bytes]:
+    path = image_path(sha256)
+    if not path.exists():
+        return None
+    return path.read_bytes()
+
+
+def delete_image(sha256: str):
+    """Remove a stored image (callers must check no other card references it)"""
+    try:
+        image_path(sha256).unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,216 @@
+"""
+Resized / re-encoded variants of stored card images
+
+Grids only need thumbnails, so `/cards/{card_id}/image?w=&format=` serves a
+smaller WebP/AVIF/JPEG copy. Variants are generated lazily on first request and
+kept in a size-bounded on-disk cache (least recently used files are evicted).
+"""
+import asyncio
+import math
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps
+
+from image_store import image_path
+from singleflight import SingleFlight
+
+IMAGE_VARIANT_DIR = Path(os.getenv("IMAGE_VARIANT_DIR", "./image_variants"))
+# Total disk budget for cached variants
+IMAGE_VARIANT_CACHE_MAX_BYTES = int(os.getenv("IMAGE_VARIANT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+
+# Requested widths are rounded up to one of these so the cache stays small
+VARIANT_WIDTHS = [64, 128, 192, 256, 384, 512, 768, 1024, 1536, 2048]
+
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+# Variants used this recently are never evicted, so a file that was just
+# returned by get_variant isn't deleted before its response has been sent
+VARIANT_EVICTION_GRACE = 60
+
+_variant_flights = SingleFlight("image_variants")
+_cache_lock = threading.Lock()
+_cache_bytes: Optional[int] = None
+
+
+def supported_formats() -> List[str]:
+    """Formats this Pillow build can encode (AVIF needs libavif or pillow-avif-plugin)"""
+    Image.init()
+    return [
+        name for name, (pil_format, _) in VARIANT_FORMATS.items()
+        if pil_format in Image.SAVE
+    ]
+
+
+def snap_width(width: int) -> int:
+    for candidate in VARIANT_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return VARIANT_WIDTHS[-1]
+
+
+def variant_path(sha256: str, width: Optional[int], fmt: str) -> Path:
+    return IMAGE_VARIANT_DIR / sha256[:2] / f"{sha256}_{width or 'full'}.{fmt}"
+
+
+def variant_media_type(fmt: str) -> str:
+    return VARIANT_FORMATS[fmt][1]
+
+
+def _render_variant(sha256: str, width: Optional[int], fmt: str) -> Path:
+    path = variant_path(sha256, width, fmt)
+    if path.exists():
+        return path
+
+    image = Image.open(image_path(sha256))
+    if width:
+        # Draft keeps both sides at least the requested size, so request the
+        # image's own aspect ratio; `width` applies after EXIF rotation
+        stored_width, stored_height = image.size
+        rotated = image.getexif().get(0x0112) in (5, 6, 7, 8)
+        scale = width / (stored_height if rotated else stored_width)
+        if scale < 1:
+            image.draft("RGB", (math.ceil(stored_width * scale), math.ceil(stored_height * scale)))
+    image = ImageOps.exif_transpose(image)
+
+    pil_format = VARIANT_FORMATS[fmt][0]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    if width and image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    save_options = {"optimize": True} if pil_format in ("JPEG", "PNG") else {}
+    if pil_format != "PNG":
+        save_options["quality"] = IMAGE_VARIANT_QUALITY
+    image.save(output, format=pil_format, **save_options)
+    data = output.getvalue()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+    _account(len(data), keep=path)
+    return path
+
+
+def _variant_files() -> List[Path]:
+    if not IMAGE_VARIANT_DIR.exists():
+        return []
+    return [path for path in IMAGE_VARIANT_DIR.glob("*/*") if not path.name.startswith(".tmp-")]
+
+
+def _account(added_bytes: int, keep: Path):
+    """
+    Track cache size and evict least recently used variants when over budget
+
+    `keep` and anything used within VARIANT_EVICTION_GRACE seconds survive, even
+    if that leaves the cache over budget for a moment.
+    """
+    global _cache_bytes
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(path.stat().st_size for path in _variant_files())
+        else:
+            _cache_bytes += added_bytes
+
+        if _cache_bytes <= IMAGE_VARIANT_CACHE_MAX_BYTES:
+            return
+
+        # Evict down to 90% of the budget so we don't evict on every new variant
+        target = IMAGE_VARIANT_CACHE_MAX_BYTES * 0.9
+        files = []
+        for path in _variant_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        _cache_bytes = sum(size for _, size, _ in files)
+        recent = time.time() - VARIANT_EVICTION_GRACE
+        for mtime, size, path in files:
+            if _cache_bytes <= target or mtime >= recent:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                _cache_bytes -= size
+            except FileNotFoundError:
+                pass
+
+
+async def get_variant(sha256: str, width: Optional[int], fmt: str) -> Path:
+    """
+    Return the path of a variant, rendering it on first request
+
+    Args:
+        sha256: Digest of the original image in the image store
+        width: Target width (already snapped), or None to keep the original size
+        fmt: Output format key from VARIANT_FORMATS
+
+    Returns:
+        Path of the cached variant file
+    """
+    path = variant_path(sha256, width, fmt)
+    if path.exists():
+        # Refresh mtime so eviction treats it as recently used
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+    # Concurrent requests for the same thumbnail render it once
+    return await _variant_flights.do(
+        (sha256, width, fmt),
+        lambda: asyncio.to_thread(_render_variant, sha256, width, fmt)
+    )
+
+
+def delete_variants(sha256: str):
+    """Remove every cached variant of an image"""
+    global _cache_bytes
+    directory = IMAGE_VARIANT_DIR / sha256[:2]
+    if not directory.exists():
+        return
+    for path in directory.glob(f"{sha256}_*"):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        with _cache_lock:
+            if _cache_bytes is not None:
+                _cache_bytes -= size
+
+
+def variant_stats() -> Dict[str, object]:
+    with _cache_lock:
+        cache_bytes = _cache_bytes
+    return {
+        "max_bytes": IMAGE_VARIANT_CACHE_MAX_BYTES,
+        "cached_bytes": cache_bytes,
+        "formats": supported_formats(),
+        "widths": VARIANT_WIDTHS,
+        "coalescing": _variant_flights.stats(),
+    }
@@ -0,0 +1,135 @@
+"""
+Gemini inference layer
+
+The google-generativeai SDK call `generate_content` is blocking, so every call
+runs on a dedicated, bounded thread pool instead of the event loop. That keeps
+`/health`, `/cards` and image requests responsive while analyses are in flight.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if not GEMINI_API_KEY:
+    raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+# Max Gemini calls running at once; extra calls wait in the executor queue
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+genai.configure(api_key=GEMINI_API_KEY)
+
+
+class GeminiInference:
+    """Runs Gemini calls off the event loop with a concurrency cap and queue metrics"""
+
+    def __init__(self, model: genai.GenerativeModel, max_concurrency: int = GEMINI_MAX_CONCURRENCY):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Counters are updated from worker threads
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        # Calls cancelled (e.g. client disconnected) before a worker picked them up
+        self.cancelled = 0
+        self.queued = 0
+        self.running = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.total_run_time = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="gemini"
+            )
+        return self._executor
+
+    async def generate_content(self, contents: Any, **kwargs) -> Any:
+        """
+        Async equivalent of `GenerativeModel.generate_content`
+
+        Args:
+            contents: Prompt (and images) passed straight to the SDK
+            **kwargs: Extra SDK arguments such as `generation_config`
+
+        Returns:
+            The SDK response object
+        """
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+            self.queued += 1
+
+        def run():
+            started_at = time.perf_counter()
+            queue_time = started_at - submitted_at
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_queue_time += queue_time
+                self.max_queue_time = max(self.max_queue_time, queue_time)
+            failed = False
+            try:
+                return self.model.generate_content(contents, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.total_run_time += time.perf_counter() - started_at
+                    if failed:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+
+        def on_done(future):
+            # A call cancelled while queued never reaches run(), so it leaves the queue here
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+                    self.cancelled += 1
+
+        future = self.executor.submit(run)
+        future.add_done_callback(on_done)
+        # Cancelling the awaiting task cancels the executor future if it hasn't started yet
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        started = self.submitted - self.queued - self.cancelled
+        return {
+            "model": GEMINI_MODEL,
+            "max_concurrency": self.max_concurrency,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "queued": self.queued,
+            "running": self.running,
+            "avg_queue_time": round(self.total_queue_time / started, 4) if started else 0.0,
+            "max_queue_time": round(self.max_queue_time, 4),
+            "avg_run_time": round(self.total_run_time / finished, 4) if finished else 0.0,
+        }
+
+
+# Singleton instance
+gemini = GeminiInference(genai.GenerativeModel(GEMINI_MODEL))
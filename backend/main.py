@@ -1,71 +1,104 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form
-from fastapi.responses import Response
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Query, Request
+from fastapi.responses import Response, StreamingResponse, FileResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-import google.generativeai as genai
+from sqlalchemy import String, and_, delete, func, or_, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
 import base64
-from PIL import Image
-from io import BytesIO
+import asyncio
+import csv
+import io
+import json
 import os
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
 from dotenv import load_dotenv
-from typing import List, Optional
-from models import PokemonCard, PriceHistory
-from database import get_db, create_tables
+from typing import List, Optional, Tuple
+import orjson
+from models import ImportJob, PokemonCard, PriceHistory
+from database import (
+    get_db, create_tables, log_storage_settings, SessionLocal, AsyncSessionLocal, async_engine,
+    IS_SQLITE
+)
 from pokemon_api import pokemon_api
+from price_refresh import price_refresher
+from analysis_jobs import analysis_jobs, image_in_use_by_jobs
+from bulk_import import (
+    IMPORT_MAX_UPLOAD_BYTES, UploadTooLarge, detect_kind, import_manager, spool_upload
+)
+from inference import gemini
+from analysis import CardAnalysisResponse, analyze_image, price_estimate_flights, pricing_stats
+from image_preprocess import preprocess_stats
+from portfolio import (
+    parse_price_string, set_card_price, apply_portfolio_delta, rebuild_portfolio_snapshot,
+    get_current_snapshot, portfolio_history, portfolio_values_days_ago
+)
+from price_history import (
+    bulk_set_prices, downsampled_price_history,
+    PRICE_HISTORY_MAX_POINTS, PRICE_HISTORY_MAX_POINTS_LIMIT
+)
+from image_store import save_image, image_path, delete_image, sniff_content_type
+from image_variants import (
+    get_variant, delete_variants, snap_width, supported_formats,
+    variant_media_type, variant_stats
+)
 
 load_dotenv()
 
+# Max images analyzed at once by /analyze-cards, and max images per batch
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "4"))
+ANALYZE_BATCH_MAX_FILES = int(os.getenv("ANALYZE_BATCH_MAX_FILES", "100"))
+# Default and maximum page size of /cards
+CARDS_PAGE_SIZE = int(os.getenv("CARDS_PAGE_SIZE", "100"))
+CARDS_PAGE_MAX = int(os.getenv("CARDS_PAGE_MAX", "1000"))
+# Rows fetched per round trip by /cards/export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Max (card_id, price) pairs accepted per /cards/prices:bulk request
+BULK_PRICE_MAX_ITEMS = int(os.getenv("BULK_PRICE_MAX_ITEMS", "10000"))
+
+# Multipart framing allowed on top of IMPORT_MAX_UPLOAD_BYTES in an /import Content-Length
+IMPORT_FORM_OVERHEAD = 64 * 1024
+
+
+class ImportSizeLimitMiddleware:
+    """
+    Reject an /import whose Content-Length is already over the limit
+
+    FastAPI parses (and spools) the whole multipart body before the endpoint
+    runs, so this has to happen in front of it. Uploads without a
+    Content-Length are still capped by spool_upload.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/import":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > IMPORT_MAX_UPLOAD_BYTES + IMPORT_FORM_OVERHEAD:
+                response = JSONResponse(
+                    status_code=413,
+                    content={"detail": f"Upload is larger than {IMPORT_MAX_UPLOAD_BYTES} bytes"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
 app = FastAPI(title="PokeWealth API")
 
-# CORS
+app.add_middleware(ImportSizeLimitMiddleware)
+
+# CORS (added last so it wraps everything, including early 413s)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Configure Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash-exp")
-
-
-class GradingCondition(BaseModel):
-    score: float
-    description: str
-
-
-class CardAnalysisResponse(BaseModel):
-    card_name: str
-    estimated_price: str
-    details: str
-    centering: Optional[GradingCondition] = None
-    corners: Optional[GradingCondition] = None
-    edges: Optional[GradingCondition] = None
-    surface: Optional[GradingCondition] = None
-    overall_grade: Optional[float] = None
-    # Real market data from Pokemon API
-    market_price: Optional[float] = None
-    price_source: Optional[str] = None  # "api" or "ai"
-    tcg_player_id: Optional[str] = None
-    set_name: Optional[str] = None
-    card_number: Optional[str] = None
-    rarity: Optional[str] = None
-    # PSA prices if available
-    psa_10_price: Optional[float] = None
-    psa_9_price: Optional[float] = None
-    psa_8_price: Optional[float] = None
-
-    is_authentic: Optional[bool] = None
-    authenticity_confidence: Optional[float] = None
-    authenticity_notes: Optional[str] = None
-
 
 class CardCreate(BaseModel):
     card_name: str
@@ -115,35 +148,40 @@ class CardResponse(BaseModel):
         from_attributes = True
 
 
+CARD_FIELDS = list(CardResponse.model_fields)
+
+
+def card_to_dict(card, fields: List[str] = CARD_FIELDS) -> dict:
+    """
+    Map a PokemonCard (or a row of selected card columns) to the CardResponse shape
+
+    Card endpoints return this dict directly through ORJSONResponse instead of
+    building a CardResponse and having FastAPI validate it again.
+    """
+    data = {field: getattr(card, field) for field in fields}
+    created_at = data.get("created_at")
+    if created_at is not None:
+        data["created_at"] = created_at.isoformat()
+    return data
+
+
 class PriceHistoryResponse(BaseModel):
     id: int
     card_id: int
     price: float
     price_display: str
     recorded_at: str
+    # OHLC of the bucket this point summarizes (equal to price for raw rows)
+    open: Optional[float] = None
+    high: Optional[float] = None
+    low: Optional[float] = None
+    samples: int = 1
 
     class Config:
         from_attributes = True
 
 
-def parse_price_string(price_str: str) -> float:
-    """Parse price string like '$50 - $100' or '$75' and return average or single value"""
-    import re
-
-    # Remove currency symbols and extract numbers
-    numbers = re.findall(r'[\d,]+\.?\d*', price_str.replace(',', ''))
-
-    if not numbers:
-        return 0.0
-
-    # Convert to floats
-    prices = [float(num) for num in numbers]
-
-    # Return average if range, single value if not
-    return sum(prices) / len(prices)
-
-
-def create_price_history_entry(card_id: int, price_display: str, db: Session):
+async def create_price_history_entry(card_id: int, price_display: str, db: AsyncSession):
     """Create a new price history entry for a card"""
     price_value = parse_price_string(price_display)
 
@@ -154,276 +192,251 @@ def create_price_history_entry(card_id: int, price_display: str, db: Session):
     )
 
     db.add(price_entry)
-    db.commit()
+    await db.commit()
     return price_entry
 
 
+async def delete_unreferenced_images(image_hashes: List[str], db: AsyncSession):
+    """Remove stored images that no remaining card or analysis job points at (images are deduplicated)"""
+    for image_sha256 in set(filter(None, image_hashes)):
+        still_used = await db.scalar(select(PokemonCard.id).where(
+            PokemonCard.image_sha256 == image_sha256).limit(1))
+        if not still_used and not await image_in_use_by_jobs(db, image_sha256):
+            delete_image(image_sha256)
+            delete_variants(image_sha256)
+
+
+class ImageFileResponse(FileResponse):
+    """FileResponse whose If-Range check uses our content-hash ETag instead of file mtime"""
+
+    # Private Starlette hook; starlette is pinned in requirements.txt because of it
+
+    def _should_use_range(self, http_if_range, stat_result) -> bool:
+        return http_if_range in (self.headers.get("etag"), self.headers.get("last-modified"))
+
+
+def image_validators(
+    request: Request,
+    path,
+    etag: str,
+    last_modified: Optional[datetime]
+) -> Tuple[dict, bool]:
+    """
+    Caching headers for an image and whether the client's copy is still current
+
+    Args:
+        request: Incoming request (If-None-Match / If-Modified-Since are read from it)
+        path: File whose mtime is used when last_modified is unknown
+        etag: Quoted ETag of the representation
+        last_modified: Last-Modified time, if known
+
+    Returns:
+        (headers, not_modified)
+    """
+    if last_modified is None:
+        last_modified = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+    elif last_modified.tzinfo is None:
+        # SQLite returns naive UTC timestamps
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified.timestamp(), usegmt=True),
+        "Cache-Control": "public, max-age=3600",
+        "Access-Control-Allow-Origin": "*"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    not_modified = False
+    if if_none_match:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        not_modified = "*" in client_etags or etag in client_etags
+    elif if_modified_since:
+        try:
+            not_modified = int(last_modified.timestamp()) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            not_modified = False
+
+    return headers, not_modified
+
+
+def conditional_image_response(
+    request: Request,
+    path,
+    media_type: str,
+    etag: str,
+    last_modified: Optional[datetime]
+) -> Response:
+    """
+    Serve an image file with validators, answering 304 when the client's copy is current
+
+    Range requests are handled by FileResponse (206 / multipart ranges).
+    """
+    headers, not_modified = image_validators(request, path, etag, last_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+
+    # Served straight from disk (sendfile where the server supports it)
+    return ImageFileResponse(path, media_type=media_type, headers=headers)
+
+
 @app.get("/")
 async def root():
     return {"message": "PokeWealth API - Snap your card. Track your value."}
 
 
 @app.post("/analyze-card", response_model=CardAnalysisResponse)
-async def analyze_card(file: UploadFile = File(...)):
+async def analyze_card(
+    http_response: Response,
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="Re-analyze even if a near-identical image was seen before"),
+    run_async: bool = Query(False, alias="async", description="Queue the analysis and return a job id right away"),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Upload a Pokemon card image and get AI-powered analysis with real market pricing
+
+    With `?async=true` the upload is queued and a 202 with a job id is returned;
+    fetch the result from `/jobs/{job_id}`.
     """
-    print("\n" + "="*80)
-    print("🎴 NEW CARD ANALYSIS REQUEST")
-    print("="*80)
+    contents = await file.read()
+    if run_async:
+        job = await analysis_jobs.submit(contents, file.filename, force)
+        return JSONResponse(
+            status_code=202,
+            content={**analysis_jobs.job_status(job), "status_url": f"/jobs/{job.id}"},
+            headers={"Location": f"/jobs/{job.id}"}
+        )
 
     try:
-        # Read and process image
-        contents = await file.read()
-        image = Image.open(BytesIO(contents))
-        print(f"📸 Image received: {file.filename}")
-
-        # Step 1: Use Gemini to identify the card and grade it
-        print("\n🤖 STEP 1: Calling Gemini AI for card identification and grading...")
-        prompt = """
-        You are a Pokemon card expert and professional grader. Analyze this Pokemon card image and provide:
-        1. The exact card name (just the Pokemon name and card variant, e.g. "Charizard ex" or "Pikachu VMAX")
-        2. The set name (e.g. "Base Set", "Temporal Forces", "Crown Zenith")
-        3. Card number if visible (e.g. "4/102" or "123")
-        4. Brief details about the card (set, rarity, condition assessment)
-        5. Professional grading assessment for each category (score 1-10):
-           - Centering: Score and comment about card centering
-           - Corners: Score and description of corner wear/condition
-           - Edges: Score and description of edge condition
-           - Surface: Score and description of surface flaws/condition
-        5. Authenticity assessment:
-           - is_authentic: true/false if the card appears authentic
-           - authenticity_confidence: number 0-100 confidence
-           - authenticity_notes: brief reasons and any counterfeit flags (e.g., wrong font, misaligned borders, holo pattern issues)
-        
-        Format your response as JSON:
-        {
-            "card_name": "Card Name Here",
-            "set_name": "Set Name Here",
-            "card_number": "123/456",
-            "details": "Brief description including set, rarity, and condition",
-            "centering": {
-                "score": 9.5,
-                "description": "Slightly bottom-heavy"
-            },
-            "corners": {
-                "score": 9.0,
-                "description": "Two tiny dots of whitening on back corners"
-            },
-            "edges": {
-                "score": 9.5,
-                "description": "Near perfect"
-            },
-            "surface": {
-                "score": 8.0,
-                "description": "One visible surface scratch on holographic area"
-            },
-            "is_authentic": true,
-            "authenticity_confidence": 92.5,
-            "authenticity_notes": "Holo pattern matches, font and border alignment correct"
-        }
-        """
+        analysis, cache_status = await analyze_image(contents, file.filename, db, force)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error analyzing card: {str(e)}")
 
-        # Call Gemini API
-        response = model.generate_content(
-            [prompt, image],
-            generation_config={
-                "temperature": 0.2,
-                "response_mime_type": "application/json"
-            }
-        )
+    if cache_status:
+        http_response.headers["X-Analysis-Cache"] = cache_status
+    return analysis
 
-        # Parse response
-        import json
-        result = json.loads(response.text)
 
-        print("\n✅ Gemini AI Response:")
-        print(f"   Card Name: {result.get('card_name', 'Unknown')}")
-        print(f"   Set: {result.get('set_name', 'Unknown')}")
-        print(f"   Card Number: {result.get('card_number', 'Unknown')}")
-        if result.get('centering'):
-            print(
-                f"   Centering: {result['centering'].get('score', 'N/A')}/10")
-        if result.get('corners'):
-            print(f"   Corners: {result['corners'].get('score', 'N/A')}/10")
-        if result.get('edges'):
-            print(f"   Edges: {result['edges'].get('score', 'N/A')}/10")
-        if result.get('surface'):
-            print(f"   Surface: {result['surface'].get('score', 'N/A')}/10")
+@app.post("/analyze-card/stream")
+async def analyze_card_stream(
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="Re-analyze even if a near-identical image was seen before")
+):
+    """
+    Analyze a card image, streaming each stage as a Server-Sent Event as soon as it is ready
 
-        # Calculate overall grade
-        grades = []
-        if result.get("centering", {}).get("score"):
-            grades.append(result["centering"]["score"])
-        if result.get("corners", {}).get("score"):
-            grades.append(result["corners"]["score"])
-        if result.get("edges", {}).get("score"):
-            grades.append(result["edges"]["score"])
-        if result.get("surface", {}).get("score"):
-            grades.append(result["surface"]["score"])
-
-        overall_grade = round(sum(grades) / len(grades), 1) if grades else None
-        if overall_grade:
-            print(f"   Overall Grade: {overall_grade}/10")
-
-        # Step 2: Fetch real market prices from Pokemon Price Tracker API
-        card_name = result.get("card_name", "Unknown Card")
-        set_name = result.get("set_name")
-
-        print(f"\n💰 STEP 2: Fetching real market prices for '{card_name}'...")
-
-        market_price = None
-        price_source = "ai"
-        estimated_price = "Unable to determine"
-        tcg_player_id = None
-        actual_set_name = set_name
-        card_number = result.get("card_number")
-        rarity = None
-        psa_10_price = None
-        psa_9_price = None
-        psa_8_price = None
-
-        # Try to fetch real market data if API key is configured
-        try:
-            if pokemon_api.api_key:
-                print(f"   🔑 Pokemon API Key configured - searching database...")
-                if set_name:
-                    print(
-                        f"   🔍 Searching for: '{card_name}' in set '{set_name}'")
-                else:
-                    print(
-                        f"   🔍 Searching for: '{card_name}' (no set specified)")
-
-                # Search for the card with PSA data
-                card_data = await pokemon_api.get_card_with_psa_data(card_name, set_name)
-
-                if card_data:
-                    print(f"\n   ✅ Card found in Pokemon API database!")
-                    # Extract price information
-                    price_info = pokemon_api.format_price_data(card_data)
-                    psa_info = pokemon_api.extract_psa_prices(card_data)
-
-                    print(f"\n   📊 Market Data:")
-                    if price_info["market_price"]:
-                        market_price = price_info["market_price"]
-                        estimated_price = f"${market_price:.2f}"
-                        price_source = "api"
-                        print(f"      💵 Market Price: ${market_price:.2f}")
-                    elif price_info["price_range"]:
-                        estimated_price = price_info["price_range"]
-                        price_source = "api"
-                        print(f"      💵 Price Range: {estimated_price}")
-
-                    # Extract additional card details
-                    tcg_player_id = card_data.get("tcgplayerId")
-                    actual_set_name = card_data.get("set", set_name)
-                    card_number = card_data.get("number", card_number)
-                    rarity = card_data.get("rarity")
-
-                    if actual_set_name:
-                        print(f"      📦 Set: {actual_set_name}")
-                    if card_number:
-                        print(f"      #️⃣  Number: {card_number}")
-                    if rarity:
-                        print(f"      ⭐ Rarity: {rarity}")
-                    if tcg_player_id:
-                        print(f"      🆔 TCGPlayer ID: {tcg_player_id}")
-
-                    # PSA prices
-                    psa_10_price = psa_info.get("psa_10")
-                    psa_9_price = psa_info.get("psa_9")
-                    psa_8_price = psa_info.get("psa_8")
-
-                    if psa_10_price or psa_9_price or psa_8_price:
-                        print(f"\n   🏆 PSA Graded Values:")
-                        if psa_10_price:
-                            print(f"      PSA 10: ${psa_10_price:.2f}")
-                        if psa_9_price:
-                            print(f"      PSA 9: ${psa_9_price:.2f}")
-                        if psa_8_price:
-                            print(f"      PSA 8: ${psa_8_price:.2f}")
-
-                    # Update details with real market info
-                    if rarity:
-                        result["details"] = f"{actual_set_name} - {rarity} - {result.get('details', '')}"
-                else:
-                    # Card not found in API, keep AI estimate
-                    print(
-                        f"   ⚠️  Card '{card_name}' not found in Pokemon API")
-                    print(f"   ℹ️  Will use AI price estimate instead")
-            else:
-                print("   ⚠️  Pokemon API key not configured")
-                print("   ℹ️  Using AI estimate only")
-        except Exception as api_error:
-            print(f"   ❌ Error fetching real prices: {api_error}")
-            print(f"   ℹ️  Falling back to AI estimate")
-
-        # If we couldn't get real pricing, generate an AI estimate
-        if price_source == "ai" and estimated_price == "Unable to determine":
-            print(f"\n   🤖 Generating AI price estimate...")
-            # Ask Gemini for a price estimate as fallback
-            price_prompt = f"What is the approximate market price for a {card_name} from {set_name or 'unknown set'} in USD? Provide just a price range like '$X - $Y' or single value '$X'."
+    Events, in order: "received"; "identified" (name, set, grades); "market"
+    (market and PSA prices); then "result" with the full CardAnalysisResponse,
+    or "error". A cache hit skips straight to "result".
+    """
+    contents = await file.read()
+    filename = file.filename
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_pipeline():
+        # Own session: the request-scoped one is closed before the body streams
+        async with AsyncSessionLocal() as db:
             try:
-                price_response = model.generate_content(price_prompt)
-                estimated_price = price_response.text.strip()
-                print(f"   💭 AI Estimate: {estimated_price}")
-            except:
-                estimated_price = "Price unavailable"
-                print(f"   ❌ Unable to generate price estimate")
-
-        print(f"\n" + "="*80)
-        print(f"📋 FINAL ANALYSIS SUMMARY")
-        print("="*80)
-        print(f"   Card: {card_name}")
-        print(f"   Price: {estimated_price} (Source: {price_source.upper()})")
-        if overall_grade:
-            print(f"   Grade: {overall_grade}/10")
-        print("="*80 + "\n")
-
-        return CardAnalysisResponse(
-            card_name=card_name,
-            estimated_price=estimated_price,
-            details=result.get("details", "No details available"),
-            centering=GradingCondition(
-                **result.get("centering", {})) if result.get("centering") else None,
-            corners=GradingCondition(
-                **result.get("corners", {})) if result.get("corners") else None,
-            edges=GradingCondition(
-                **result.get("edges", {})) if result.get("edges") else None,
-            surface=GradingCondition(
-                **result.get("surface", {})) if result.get("surface") else None,
-            overall_grade=overall_grade,
-            is_authentic=result.get("is_authentic"),
-            authenticity_confidence=result.get("authenticity_confidence"),
-            authenticity_notes=result.get("authenticity_notes"),
-            market_price=market_price,
-            price_source=price_source,
-            tcg_player_id=tcg_player_id,
-            set_name=actual_set_name,
-            card_number=card_number,
-            rarity=rarity,
-            psa_10_price=psa_10_price,
-            psa_9_price=psa_9_price,
-            psa_8_price=psa_8_price
-        )
+                analysis, cache_status = await analyze_image(
+                    contents, filename, db, force,
+                    on_progress=lambda stage, data: events.put_nowait((stage, data))
+                )
+                events.put_nowait(("result", {"cache": cache_status, "result": analysis.model_dump()}))
+            except Exception as e:
+                events.put_nowait(("error", {"detail": f"Error analyzing card: {str(e)}"}))
+            finally:
+                events.put_nowait(None)
+
+    def sse(event: str, data: dict) -> bytes:
+        return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+    async def stream_events():
+        task = asyncio.create_task(run_pipeline())
+        try:
+            yield sse("received", {"filename": filename, "bytes": len(contents)})
+            while (item := await events.get()) is not None:
+                yield sse(*item)
+        finally:
+            # Client went away: stop spending Gemini / Pokemon API calls on it
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    except json.JSONDecodeError as e:
-        # Fallback if JSON parsing fails
-        print(f"\n❌ ERROR: Failed to parse Gemini AI response")
-        print(f"   Details: {str(e)}")
-        print("="*80 + "\n")
-        return CardAnalysisResponse(
-            card_name="Analysis Error",
-            estimated_price="Unable to determine",
-            details=response.text if 'response' in locals() else "Error analyzing card",
-            price_source="error"
-        )
-    except Exception as e:
-        print(f"\n❌ CRITICAL ERROR during card analysis")
-        print(f"   Error: {str(e)}")
-        print("="*80 + "\n")
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish before answering")
+):
+    """
+    Status of a queued analysis; `result` holds the CardAnalysisResponse once status is "done"
+
+    With `wait` the request is held open (up to ANALYSIS_JOB_MAX_WAIT seconds)
+    until the job finishes, so clients can long-poll instead of polling in a loop.
+    """
+    job = await analysis_jobs.get(job_id, wait)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return analysis_jobs.job_status(job)
+
+
+@app.post("/analyze-cards")
+async def analyze_cards(
+    files: List[UploadFile] = File(...),
+    force: bool = Query(False, description="Re-analyze even if a near-identical image was seen before")
+):
+    """
+    Analyze many card images concurrently, streaming one NDJSON line per image as it finishes
+
+    Each line is {"index", "filename", "status", "cache", "result"} where result is a
+    CardAnalysisResponse, or {"index", "filename", "status": "error", "error"} on failure.
+    """
+    if len(files) > ANALYZE_BATCH_MAX_FILES:
         raise HTTPException(
-            status_code=500, detail=f"Error analyzing card: {str(e)}")
+            status_code=413, detail=f"Too many files (max {ANALYZE_BATCH_MAX_FILES})")
+
+    # Read uploads up front; they are closed once the streaming response starts
+    uploads = [(file.filename, await file.read()) for file in files]
+    semaphore = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+
+    async def analyze_one(index: int, filename: Optional[str], contents: bytes) -> dict:
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                try:
+                    analysis, cache_status = await analyze_image(contents, filename, db, force)
+                    return {
+                        "index": index,
+                        "filename": filename,
+                        "status": "ok",
+                        "cache": cache_status,
+                        "result": analysis.model_dump()
+                    }
+                except Exception as e:
+                    return {"index": index, "filename": filename, "status": "error", "error": str(e)}
+
+    async def stream_results():
+        tasks = [
+            asyncio.create_task(analyze_one(index, filename, contents))
+            for index, (filename, contents) in enumerate(uploads)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done) + b"\n"
+        finally:
+            # Client went away - stop the analyses that haven't finished
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 
 @app.post("/save-card", response_model=CardResponse)
@@ -452,22 +465,26 @@ async def save_card(
     is_authentic: Optional[bool] = Form(None),
     authenticity_confidence: Optional[float] = Form(None),
     authenticity_notes: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Save a Pokemon card with grading information and market data to the database
     """
     print(f"\n💾 Saving card: {card_name} (${estimated_price})")
     try:
-        # Read image data
+        # Read image data and write it to the content-addressed image store
         image_contents = await image_file.read()
+        image_sha256 = await asyncio.to_thread(save_image, image_contents)
+        image_content_type = sniff_content_type(image_contents, image_file.filename)
 
         # Create new card record
         db_card = PokemonCard(
             card_name=card_name,
             estimated_price=estimated_price,
             details=details,
-            image_data=image_contents,
+            image_sha256=image_sha256,
+            image_size=len(image_contents),
+            image_content_type=image_content_type,
             image_filename=image_file.filename,
             centering_score=centering_score,
             centering_comment=centering_comment,
@@ -505,229 +522,369 @@ async def save_card(
         if grades:
             db_card.overall_grade = round(sum(grades) / len(grades), 1)
 
+        set_card_price(db_card, estimated_price)
+
         db.add(db_card)
-        db.commit()
-        db.refresh(db_card)
+        await db.run_sync(apply_portfolio_delta, db_card.price_mid or 0.0, card_delta=1)
+        await db.commit()
+        await db.refresh(db_card)
 
         print(f"   ✅ Card saved to database with ID: {db_card.id}")
 
         # Create initial price history entry
-        create_price_history_entry(db_card.id, estimated_price, db)
+        await create_price_history_entry(db_card.id, estimated_price, db)
         print(f"   📊 Price history entry created\n")
 
-        return CardResponse(
-            id=db_card.id,
-            card_name=db_card.card_name,
-            estimated_price=db_card.estimated_price,
-            details=db_card.details,
-            image_filename=db_card.image_filename,
-            created_at=db_card.created_at.isoformat(),
-            centering_score=db_card.centering_score,
-            centering_comment=db_card.centering_comment,
-            corners_score=db_card.corners_score,
-            corners_description=db_card.corners_description,
-            edges_score=db_card.edges_score,
-            edges_description=db_card.edges_description,
-            surface_score=db_card.surface_score,
-            surface_description=db_card.surface_description,
-            overall_grade=db_card.overall_grade,
-            market_price=db_card.market_price,
-            price_source=db_card.price_source,
-            tcg_player_id=db_card.tcg_player_id,
-            set_name=db_card.set_name,
-            card_number=db_card.card_number,
-            rarity=db_card.rarity,
-            psa_10_price=db_card.psa_10_price,
-            psa_9_price=db_card.psa_9_price,
-            psa_8_price=db_card.psa_8_price,
-            is_authentic=db_card.is_authentic,
-            authenticity_confidence=db_card.authenticity_confidence,
-            authenticity_notes=db_card.authenticity_notes
-        )
+        return ORJSONResponse(card_to_dict(db_card))
 
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error saving card: {str(e)}")
 
 
+def encode_cursor(created_at, card_id: int) -> str:
+    """Opaque keyset cursor for the position after (created_at, id)"""
+    raw = json.dumps([str(created_at) if IS_SQLITE else created_at.isoformat(), card_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, card_id = json.loads(raw)
+        return (created_at if IS_SQLITE else datetime.fromisoformat(created_at)), int(card_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_card_fields(fields: Optional[str]) -> List[str]:
+    """Validate a comma-separated `fields=` projection (all CardResponse fields if empty)"""
+    if not fields:
+        return CARD_FIELDS
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in CARD_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def created_at_key():
+    # SQLite stores timestamps as text in more than one format (server default
+    # vs. Python-bound values), so compare the stored text itself; other
+    # databases compare real timestamps
+    return type_coerce(PokemonCard.created_at, String) if IS_SQLITE else PokemonCard.created_at
+
+
 @app.get("/cards", response_model=List[CardResponse])
-async def get_cards(db: Session = Depends(get_db)):
+async def get_cards(
+    limit: Optional[int] = Query(None, ge=1, le=CARDS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated CardResponse fields to return"),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get all saved Pokemon cards
+    Get saved Pokemon cards, newest first
+
+    Without `limit` or `cursor` the whole collection is returned, as before
+    pagination existed. Otherwise one page is returned (CARDS_PAGE_SIZE cards
+    unless `limit` is given) and the cursor for the next page is in the
+    X-Next-Cursor header (absent on the last page). Only the requested
+    `fields` are read.
     """
-    cards = db.query(PokemonCard).order_by(PokemonCard.created_at.desc()).all()
-    return [
-        CardResponse(
-            id=card.id,
-            card_name=card.card_name,
-            estimated_price=card.estimated_price,
-            details=card.details,
-            image_filename=card.image_filename,
-            created_at=card.created_at.isoformat(),
-            centering_score=card.centering_score,
-            centering_comment=card.centering_comment,
-            corners_score=card.corners_score,
-            corners_description=card.corners_description,
-            edges_score=card.edges_score,
-            edges_description=card.edges_description,
-            surface_score=card.surface_score,
-            surface_description=card.surface_description,
-            overall_grade=card.overall_grade,
-            is_authentic=card.is_authentic,
-            authenticity_confidence=card.authenticity_confidence,
-            authenticity_notes=card.authenticity_notes,
-            market_price=card.market_price,
-            price_source=card.price_source,
-            tcg_player_id=card.tcg_player_id,
-            set_name=card.set_name,
-            card_number=card.card_number,
-            rarity=card.rarity,
-            psa_10_price=card.psa_10_price,
-            psa_9_price=card.psa_9_price,
-            psa_8_price=card.psa_8_price
-        )
-        for card in cards
-    ]
+    selected = parse_card_fields(fields)
+    created_at = created_at_key()
+    query = select(
+        PokemonCard.id.label("_id"),
+        created_at.label("_created_at"),
+        *[getattr(PokemonCard, field) for field in selected]
+    ).order_by(PokemonCard.created_at.desc(), PokemonCard.id.desc())
+
+    paginated = limit is not None or cursor is not None
+    if paginated:
+        limit = limit or CARDS_PAGE_SIZE
+        query = query.limit(limit + 1)
+
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            created_at < cursor_created_at,
+            and_(created_at == cursor_created_at, PokemonCard.id < cursor_id)
+        ))
+
+    rows = (await db.execute(query)).all()
+    headers = {}
+    if paginated and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]._created_at, rows[-1]._id)
+
+    # Not validated against CardResponse, so projections stay partial
+    return ORJSONResponse([card_to_dict(row, selected) for row in rows], headers=headers)
+
+
+@app.get("/cards/export")
+async def export_cards(
+    export_format: str = Query("ndjson", alias="format", description="ndjson or csv"),
+    fields: Optional[str] = Query(None, description="Comma-separated CardResponse fields to export")
+):
+    """
+    Stream the whole collection as NDJSON or CSV, newest first
+
+    Rows are fetched from a server-side cursor EXPORT_BATCH_SIZE at a time and
+    written out as they arrive, so memory use doesn't grow with the collection.
+    """
+    export_format = export_format.lower()
+    if export_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+
+    selected = parse_card_fields(fields)
+    query = select(*[getattr(PokemonCard, field) for field in selected]).order_by(
+        PokemonCard.created_at.desc(), PokemonCard.id.desc()
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    async def stream_rows():
+        # The request's session is closed before the body is sent, so use our own
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query)
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(selected)
+                async for rows in result.partitions():
+                    for row in rows:
+                        writer.writerow(card_to_dict(row, selected).values())
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                async for rows in result.partitions():
+                    yield b"".join(orjson.dumps(card_to_dict(row, selected)) + b"\n" for row in rows)
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="pokewealth-cards.{export_format}"'}
+    )
 
 
 @app.get("/cards/{card_id}", response_model=CardResponse)
-async def get_card(card_id: int, db: Session = Depends(get_db)):
+async def get_card(card_id: int, db: AsyncSession = Depends(get_db)):
     """
     Get a specific Pokemon card by ID
     """
-    card = db.query(PokemonCard).filter(PokemonCard.id == card_id).first()
+    card = await db.get(PokemonCard, card_id)
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
 
-    return CardResponse(
-        id=card.id,
-        card_name=card.card_name,
-        estimated_price=card.estimated_price,
-        details=card.details,
-        image_filename=card.image_filename,
-        created_at=card.created_at.isoformat(),
-        centering_score=card.centering_score,
-        centering_comment=card.centering_comment,
-        corners_score=card.corners_score,
-        corners_description=card.corners_description,
-        edges_score=card.edges_score,
-        edges_description=card.edges_description,
-        surface_score=card.surface_score,
-        surface_description=card.surface_description,
-        overall_grade=card.overall_grade,
-        market_price=card.market_price,
-        price_source=card.price_source,
-        tcg_player_id=card.tcg_player_id,
-        set_name=card.set_name,
-        card_number=card.card_number,
-        rarity=card.rarity,
-        psa_10_price=card.psa_10_price,
-        psa_9_price=card.psa_9_price,
-        psa_8_price=card.psa_8_price,
-        is_authentic=card.is_authentic,
-        authenticity_confidence=card.authenticity_confidence,
-        authenticity_notes=card.authenticity_notes
-    )
+    return ORJSONResponse(card_to_dict(card))
 
 
 @app.get("/cards/{card_id}/image")
-async def get_card_image(card_id: int, db: Session = Depends(get_db)):
+async def get_card_image(
+    request: Request,
+    card_id: int,
+    w: Optional[int] = Query(None, ge=16, le=4096, description="Resize to this width (rounded up to a cached size)"),
+    image_format: Optional[str] = Query(None, alias="format", description="webp, avif, jpeg or png"),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get the image for a specific Pokemon card
+    Get the image for a specific Pokemon card, optionally as a resized/re-encoded variant
+
+    Supports ETag/Last-Modified revalidation (304) and Range requests (206).
     """
-    card = db.query(PokemonCard).filter(PokemonCard.id == card_id).first()
-    if not card or not card.image_data:
+    if image_format:
+        image_format = image_format.lower()
+        if image_format not in supported_formats():
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported format '{image_format}' (supported: {', '.join(supported_formats())})")
+
+    card = (await db.execute(select(
+        PokemonCard.image_sha256,
+        PokemonCard.image_filename,
+        PokemonCard.image_content_type,
+        PokemonCard.created_at
+    ).where(PokemonCard.id == card_id))).first()
+    if not card or not card.image_sha256:
         raise HTTPException(status_code=404, detail="Card or image not found")
 
-    # Determine content type based on file extension or default to jpeg
-    content_type = "image/jpeg"
-    if card.image_filename:
-        if card.image_filename.lower().endswith('.png'):
-            content_type = "image/png"
-        elif card.image_filename.lower().endswith('.gif'):
-            content_type = "image/gif"
-        elif card.image_filename.lower().endswith('.webp'):
-            content_type = "image/webp"
-
-    return Response(
-        content=card.image_data,
+    path = image_path(card.image_sha256)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Card or image not found")
+
+    if w or image_format:
+        variant_format = image_format or "webp"
+        variant_width = snap_width(w) if w else None
+        # Validators come from the original, so a revalidation never renders the variant
+        headers, not_modified = image_validators(
+            request,
+            path,
+            etag=f'"{card.image_sha256}-{variant_width or "full"}.{variant_format}"',
+            last_modified=card.created_at
+        )
+        if not_modified:
+            return Response(status_code=304, headers=headers)
+        variant = await get_variant(card.image_sha256, variant_width, variant_format)
+        return ImageFileResponse(variant, media_type=variant_media_type(variant_format), headers=headers)
+
+    # Content type was sniffed from the bytes on save; older rows fall back to sniffing the file
+    content_type = card.image_content_type or sniff_content_type(path, card.image_filename)
+
+    return conditional_image_response(
+        request,
+        path,
         media_type=content_type,
-        headers={
-            "Cache-Control": "public, max-age=3600",
-            "Access-Control-Allow-Origin": "*"
-        }
+        etag=f'"{card.image_sha256}"',
+        last_modified=card.created_at
     )
 
+
 @app.delete("/cards/{card_id}")
-async def delete_card(card_id: int, db: Session = Depends(get_db)):
+async def delete_card(card_id: int, db: AsyncSession = Depends(get_db)):
     """
     Delete a specific Pokemon card from the collection
     """
-    card = db.query(PokemonCard).filter(PokemonCard.id == card_id).first()
+    card = await db.get(PokemonCard, card_id)
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
     
     try:
-        db.delete(card)
-        db.commit()
+        image_sha256 = card.image_sha256
+        card_value = card.price_mid or 0.0
+        await db.delete(card)
+        await db.run_sync(apply_portfolio_delta, -card_value, card_delta=-1)
+        await db.commit()
+        await delete_unreferenced_images([image_sha256], db)
         return {"status": "ok", "message": f"Card {card_id} deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting card: {str(e)}")
 
 
 @app.get("/debug/cards")
-async def debug_cards(db: Session = Depends(get_db)):
+async def debug_cards(db: AsyncSession = Depends(get_db)):
     """
     Debug endpoint to check what cards are in the database
     """
-    cards = db.query(PokemonCard).all()
+    cards = (await db.execute(select(
+        PokemonCard.id,
+        PokemonCard.card_name,
+        PokemonCard.image_sha256,
+        PokemonCard.image_filename,
+        PokemonCard.image_size
+    ))).all()
     return {
         "total_cards": len(cards),
         "cards": [
             {
                 "id": card.id,
                 "card_name": card.card_name,
-                "has_image": bool(card.image_data),
+                "has_image": bool(card.image_sha256),
                 "image_filename": card.image_filename,
-                "image_size": len(card.image_data) if card.image_data else 0
+                "image_size": card.image_size or 0
             }
             for card in cards
         ]
     }
 
 
+@app.get("/debug/image-variants")
+async def debug_image_variants():
+    """
+    Debug endpoint to inspect the thumbnail/variant disk cache
+    """
+    return variant_stats()
+
+
+@app.get("/debug/pokemon-api")
+async def debug_pokemon_api():
+    """
+    Debug endpoint to inspect the Pokemon API connection pool, market data cache
+    and request coalescing
+    """
+    return {
+        "pool": pokemon_api.pool_stats(),
+        "cache": pokemon_api.cache_stats(),
+        "coalescing": pokemon_api.coalescing_stats()
+    }
+
+
+@app.get("/debug/price-refresh")
+async def debug_price_refresh():
+    """
+    Debug endpoint to inspect the background price refresh: progress of the
+    current run and duration of recent runs
+    """
+    return await price_refresher.stats()
+
+
+@app.post("/price-refresh/run")
+async def run_price_refresh():
+    """
+    Start a collection-wide price refresh now instead of waiting for the schedule
+    """
+    if not price_refresher.trigger():
+        raise HTTPException(status_code=503, detail="Price refresh scheduler is not running")
+    return {"message": "Price refresh started"}
+
+
+@app.get("/debug/inference")
+async def debug_inference():
+    """
+    Debug endpoint to inspect Gemini concurrency, queue times, price-estimate coalescing,
+    hedged pricing and image preprocessing savings
+    """
+    return {
+        "gemini": gemini.stats(),
+        "coalescing": price_estimate_flights.stats(),
+        "price_hedging": pricing_stats(),
+        "preprocessing": preprocess_stats()
+    }
+
+
 @app.delete("/debug/cards")
-async def delete_all_cards(db: Session = Depends(get_db)):
+async def delete_all_cards(db: AsyncSession = Depends(get_db)):
     """
     Danger: Deletes all cards. For development/debugging only.
     """
     try:
-        db.query(PokemonCard).delete()
-        db.commit()
+        image_hashes = (await db.scalars(select(PokemonCard.image_sha256))).all()
+        await db.execute(delete(PokemonCard))
+        await db.run_sync(rebuild_portfolio_snapshot)
+        await db.commit()
+        await delete_unreferenced_images(image_hashes, db)
         return {"status": "ok", "deleted": True}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Failed to clear cards: {str(e)}")
 
 
 @app.get("/cards/{card_id}/price-history", response_model=List[PriceHistoryResponse])
-async def get_card_price_history(card_id: int, db: Session = Depends(get_db)):
+async def get_card_price_history(
+    card_id: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    max_points: int = Query(PRICE_HISTORY_MAX_POINTS, ge=1, le=PRICE_HISTORY_MAX_POINTS_LIMIT),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    Get price history for a specific card
+    Get price history for a specific card, newest first
+
+    Only rows between `from` and `to` are included, and long histories are
+    downsampled to at most `max_points` OHLC points.
     """
-    price_history = db.query(PriceHistory).filter(
-        PriceHistory.card_id == card_id).order_by(PriceHistory.recorded_at.desc()).all()
+    # Stored times are naive UTC; compare like with like
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    points = await db.run_sync(downsampled_price_history, card_id, start, end, max_points)
     return [
-        PriceHistoryResponse(
-            id=entry.id,
-            card_id=entry.card_id,
-            price=entry.price,
-            price_display=entry.price_display,
-            recorded_at=entry.recorded_at.isoformat()
-        )
-        for entry in price_history
+        PriceHistoryResponse(**{**point, "recorded_at": point["recorded_at"].isoformat()})
+        for point in points
     ]
 
 
@@ -735,80 +892,137 @@ async def get_card_price_history(card_id: int, db: Session = Depends(get_db)):
 async def update_card_price(
     card_id: int,
     new_price: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the price of a card and add to price history
     """
-    card = db.query(PokemonCard).filter(PokemonCard.id == card_id).first()
+    card = await db.get(PokemonCard, card_id)
     if not card:
         raise HTTPException(status_code=404, detail="Card not found")
 
     # Update card price
-    card.estimated_price = new_price
-    db.commit()
+    old_value = card.price_mid or 0.0
+    set_card_price(card, new_price)
+    await db.run_sync(apply_portfolio_delta, (card.price_mid or 0.0) - old_value)
+    await db.commit()
 
     # Add to price history
-    create_price_history_entry(card_id, new_price, db)
+    await create_price_history_entry(card_id, new_price, db)
 
     return {"status": "success", "message": "Price updated successfully"}
 
 
+class BulkPriceItem(BaseModel):
+    card_id: int
+    price: str
+
+
+class BulkPriceRequest(BaseModel):
+    prices: List[BulkPriceItem]
+
+
+@app.post("/cards/prices:bulk")
+async def bulk_update_prices(request: BulkPriceRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Update the prices of many cards in one transaction
+
+    All cards are updated with one UPDATE and their price history with one
+    INSERT. Returns a status per item: "updated", "not_found", "invalid" (empty
+    price) or "duplicate" (a later item for the same card wins).
+    """
+    if len(request.prices) > BULK_PRICE_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {BULK_PRICE_MAX_ITEMS} prices per request"
+        )
+
+    requested_ids = {item.card_id for item in request.prices}
+    existing_ids = set((await db.scalars(
+        select(PokemonCard.id).where(PokemonCard.id.in_(requested_ids))
+    )).all()) if requested_ids else set()
+
+    # Index of the last item per card, so the last price for a card wins
+    last_index = {item.card_id: index for index, item in enumerate(request.prices)}
+
+    results = []
+    updates = []
+    for index, item in enumerate(request.prices):
+        price = item.price.strip()
+        if item.card_id not in existing_ids:
+            status = "not_found"
+        elif not price:
+            status = "invalid"
+        elif last_index[item.card_id] != index:
+            status = "duplicate"
+        else:
+            status = "updated"
+            updates.append({"id": item.card_id, "estimated_price": price})
+        results.append({"card_id": item.card_id, "status": status})
+
+    value_delta = await db.run_sync(bulk_set_prices, updates)
+    await db.commit()
+
+    return {
+        "status": "success",
+        "updated": len(updates),
+        "value_change": value_delta,
+        "results": results,
+    }
+
+
+@app.post("/import", status_code=202)
+async def import_collection(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    """
+    Import a collection from a ZIP of card images or a CSV with name, set, number, price columns
+
+    The upload is spooled to disk and processed in the background; poll
+    `/imports/{job_id}` for progress.
+    """
+    try:
+        spool_path = await asyncio.to_thread(spool_upload, file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    kind = await asyncio.to_thread(detect_kind, spool_path)
+    if kind is None:
+        os.remove(spool_path)
+        raise HTTPException(status_code=400, detail="Upload a .zip of card images or a .csv file")
+
+    job = ImportJob(kind=kind, filename=file.filename, spool_path=str(spool_path), status="queued")
+    db.add(job)
+    await db.commit()
+    import_manager.submit(job.id)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/imports/{job.id}"}
+
+
+@app.get("/imports/{job_id}")
+async def get_import_status(job_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Progress of a bulk import: item counts, throughput and the first failures
+    """
+    job = await db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return import_manager.job_status(job)
+
+
 @app.get("/portfolio/analytics")
-async def get_portfolio_analytics(db: Session = Depends(get_db)):
+async def get_portfolio_analytics(db: AsyncSession = Depends(get_db)):
     """
     Get portfolio analytics including total value and price changes
     """
-    from datetime import datetime, timedelta
-
-    # Get all cards with their latest prices
-    cards = db.query(PokemonCard).all()
-
-    total_value = 0
-    total_value_1d_ago = 0
-    total_value_1m_ago = 0
-    total_value_3m_ago = 0
-    total_value_1y_ago = 0
-
-    now = datetime.utcnow()
-    one_day_ago = now - timedelta(days=1)
-    one_month_ago = now - timedelta(days=30)
-    three_months_ago = now - timedelta(days=90)
-    one_year_ago = now - timedelta(days=365)
-
-    for card in cards:
-        current_price = parse_price_string(card.estimated_price)
-        total_value += current_price
-
-        # Get historical prices
-        price_1d = db.query(PriceHistory).filter(
-            PriceHistory.card_id == card.id,
-            PriceHistory.recorded_at <= one_day_ago
-        ).order_by(PriceHistory.recorded_at.desc()).first()
-
-        price_1m = db.query(PriceHistory).filter(
-            PriceHistory.card_id == card.id,
-            PriceHistory.recorded_at <= one_month_ago
-        ).order_by(PriceHistory.recorded_at.desc()).first()
-
-        price_3m = db.query(PriceHistory).filter(
-            PriceHistory.card_id == card.id,
-            PriceHistory.recorded_at <= three_months_ago
-        ).order_by(PriceHistory.recorded_at.desc()).first()
-
-        price_1y = db.query(PriceHistory).filter(
-            PriceHistory.card_id == card.id,
-            PriceHistory.recorded_at <= one_year_ago
-        ).order_by(PriceHistory.recorded_at.desc()).first()
-
-        if price_1d:
-            total_value_1d_ago += price_1d.price
-        if price_1m:
-            total_value_1m_ago += price_1m.price
-        if price_3m:
-            total_value_3m_ago += price_3m.price
-        if price_1y:
-            total_value_1y_ago += price_1y.price
+    # Current totals come from the incrementally maintained snapshot
+    current = await db.run_sync(get_current_snapshot)
+    total_value = current.total_value
+
+    # Past totals are the daily snapshot closes, so cards added or removed since
+    # then count as changes in value, the same as on the history chart
+    (
+        total_value_1d_ago,
+        total_value_1m_ago,
+        total_value_3m_ago,
+        total_value_1y_ago
+    ) = await db.run_sync(portfolio_values_days_ago, [1, 30, 90, 365])
 
     def calculate_change(current, historical):
         if historical == 0:
@@ -817,7 +1031,7 @@ async def get_portfolio_analytics(db: Session = Depends(get_db)):
 
     return {
         "total_value": total_value,
-        "total_cards": len(cards),
+        "total_cards": current.total_cards,
         "price_changes": {
             "1_day": {
                 "value": total_value - total_value_1d_ago,
@@ -839,6 +1053,21 @@ async def get_portfolio_analytics(db: Session = Depends(get_db)):
     }
 
 
+@app.get("/portfolio/history")
+async def get_portfolio_history(
+    days: int = Query(365, ge=1, le=3650),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get daily portfolio value snapshots for charting
+    """
+    current = await db.run_sync(get_current_snapshot)
+    return {
+        "current": {"total_value": current.total_value, "total_cards": current.total_cards},
+        "history": await db.run_sync(portfolio_history, days)
+    }
+
+
 class DeckGenerationRequest(BaseModel):
     cards: List[dict]
 
@@ -847,8 +1076,17 @@ class BinderGenerationRequest(BaseModel):
     cards: List[dict]
 
 
+async def total_value_of_cards(cards: List[dict], db: AsyncSession) -> float:
+    """Sum the stored numeric prices of the given cards in SQL"""
+    card_ids = [card["id"] for card in cards if card.get("id") is not None]
+    if not card_ids:
+        return 0.0
+    return await db.scalar(select(func.coalesce(func.sum(PokemonCard.price_mid), 0.0)).where(
+        PokemonCard.id.in_(card_ids)))
+
+
 @app.post("/generate-deck")
-async def generate_deck(request: DeckGenerationRequest):
+async def generate_deck(request: DeckGenerationRequest, db: AsyncSession = Depends(get_db)):
     """
     Generate a Pokemon deck using AI based on available cards
     """
@@ -881,7 +1119,7 @@ async def generate_deck(request: DeckGenerationRequest):
         """
 
         # Call Gemini API
-        response = model.generate_content(
+        response = await gemini.generate_content(
             prompt,
             generation_config={
                 "temperature": 0.7,
@@ -901,7 +1139,7 @@ async def generate_deck(request: DeckGenerationRequest):
             "name": "AI Generated Deck",
             "description": "A balanced deck generated by AI",
             "cards": request.cards[:20] if len(request.cards) >= 20 else request.cards,
-            "totalValue": sum(float(card['price'].replace('$', '').replace(',', '')) for card in request.cards[:20]),
+            "totalValue": await total_value_of_cards(request.cards[:20], db),
             "strategy": "AI-generated deck with balanced composition"
         }
     except Exception as e:
@@ -910,7 +1148,7 @@ async def generate_deck(request: DeckGenerationRequest):
 
 
 @app.post("/generate-binder")
-async def generate_binder(request: BinderGenerationRequest):
+async def generate_binder(request: BinderGenerationRequest, db: AsyncSession = Depends(get_db)):
     """
     Generate a Pokemon card binder with AI-organized groups
     """
@@ -950,7 +1188,7 @@ async def generate_binder(request: BinderGenerationRequest):
         """
 
         # Call Gemini API
-        response = model.generate_content(
+        response = await gemini.generate_content(
             prompt,
             generation_config={
                 "temperature": 0.5,
@@ -985,7 +1223,7 @@ async def generate_binder(request: BinderGenerationRequest):
             "name": "AI Organized Binder",
             "groups": groups,
             "totalCards": len(card_ids),
-            "totalValue": sum(float(card['price'].replace('$', '').replace(',', '')) for card in request.cards)
+            "totalValue": await total_value_of_cards(request.cards, db)
         }
     except Exception as e:
         raise HTTPException(
@@ -1002,3 +1240,27 @@ async def health():
 @app.on_event("startup")
 async def startup_event():
     create_tables()
+    log_storage_settings()
+
+    # Recompute the running portfolio totals once so incremental updates start from an exact value
+    db = SessionLocal()
+    try:
+        rebuild_portfolio_snapshot(db)
+        db.commit()
+    finally:
+        db.close()
+
+    await pokemon_api.start()
+    price_refresher.start()
+    import_manager.start()
+    await analysis_jobs.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await price_refresher.stop()
+    await import_manager.stop()
+    await analysis_jobs.stop()
+    await pokemon_api.close()
+    gemini.shutdown()
+    await async_engine.dispose()
@@ -0,0 +1,91 @@
+"""Move card images out of pokemon_cards into the image store
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Every migration checks the live schema first: fresh databases are created
+from models.py by create_all and only need to be stamped.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from image_store import load_image, save_image
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "pokemon_cards" not in inspector.get_table_names():
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("pokemon_cards")}
+    indexes = {index["name"] for index in inspector.get_indexes("pokemon_cards")}
+
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        if "image_sha256" not in columns:
+            batch_op.add_column(sa.Column("image_sha256", sa.String(64), nullable=True))
+        if "image_size" not in columns:
+            batch_op.add_column(sa.Column("image_size", sa.Integer(), nullable=True))
+    if "ix_pokemon_cards_image_sha256" not in indexes:
+        op.create_index("ix_pokemon_cards_image_sha256", "pokemon_cards", ["image_sha256"])
+
+    if "image_data" not in columns:
+        return
+
+    cards = sa.table(
+        "pokemon_cards",
+        sa.column("id", sa.Integer),
+        sa.column("image_data", sa.LargeBinary),
+        sa.column("image_sha256", sa.String),
+        sa.column("image_size", sa.Integer),
+    )
+    card_ids = bind.execute(
+        sa.select(cards.c.id).where(cards.c.image_data.isnot(None))
+    ).scalars().all()
+
+    # One blob at a time so the migration never holds the whole table in memory
+    for card_id in card_ids:
+        image_data = bind.execute(
+            sa.select(cards.c.image_data).where(cards.c.id == card_id)
+        ).scalar()
+        bind.execute(
+            cards.update().where(cards.c.id == card_id).values(
+                image_sha256=save_image(image_data),
+                image_size=len(image_data),
+            )
+        )
+    print(f"📦 Moved {len(card_ids)} card images into the image store")
+
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        batch_op.drop_column("image_data")
+
+
+def downgrade():
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        batch_op.add_column(sa.Column("image_data", sa.LargeBinary(), nullable=True))
+
+    bind = op.get_bind()
+    cards = sa.table(
+        "pokemon_cards",
+        sa.column("id", sa.Integer),
+        sa.column("image_data", sa.LargeBinary),
+        sa.column("image_sha256", sa.String),
+    )
+    rows = bind.execute(
+        sa.select(cards.c.id, cards.c.image_sha256).where(cards.c.image_sha256.isnot(None))
+    ).all()
+    for card_id, image_sha256 in rows:
+        bind.execute(
+            cards.update().where(cards.c.id == card_id).values(image_data=load_image(image_sha256))
+        )
+
+    op.drop_index("ix_pokemon_cards_image_sha256", table_name="pokemon_cards")
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        batch_op.drop_column("image_size")
+        batch_op.drop_column("image_sha256")
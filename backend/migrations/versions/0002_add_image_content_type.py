@@ -0,0 +1,55 @@
+"""Store the sniffed image content type on pokemon_cards
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from image_store import image_path, sniff_content_type
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "pokemon_cards" not in inspector.get_table_names():
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("pokemon_cards")}
+    if "image_content_type" not in columns:
+        with op.batch_alter_table("pokemon_cards") as batch_op:
+            batch_op.add_column(sa.Column("image_content_type", sa.String(100), nullable=True))
+
+    cards = sa.table(
+        "pokemon_cards",
+        sa.column("id", sa.Integer),
+        sa.column("image_sha256", sa.String),
+        sa.column("image_filename", sa.String),
+        sa.column("image_content_type", sa.String),
+    )
+    rows = bind.execute(
+        sa.select(cards.c.id, cards.c.image_sha256, cards.c.image_filename).where(
+            cards.c.image_sha256.isnot(None),
+            cards.c.image_content_type.is_(None),
+        )
+    ).all()
+    for card_id, image_sha256, image_filename in rows:
+        path = image_path(image_sha256)
+        if not path.exists():
+            continue
+        bind.execute(
+            cards.update().where(cards.c.id == card_id).values(
+                image_content_type=sniff_content_type(path, image_filename)
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        batch_op.drop_column("image_content_type")
@@ -0,0 +1,31 @@
+"""Add composite (card_id, recorded_at) index on price_history
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "price_history" not in inspector.get_table_names():
+        return
+
+    indexes = {index["name"] for index in inspector.get_indexes("price_history")}
+    if "ix_price_history_card_id_recorded_at" not in indexes:
+        op.create_index(
+            "ix_price_history_card_id_recorded_at",
+            "price_history",
+            ["card_id", "recorded_at"]
+        )
+
+
+def downgrade():
+    op.drop_index("ix_price_history_card_id_recorded_at", table_name="price_history")
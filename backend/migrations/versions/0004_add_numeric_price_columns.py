@@ -0,0 +1,71 @@
+"""Add parsed numeric price columns to pokemon_cards and backfill them
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from portfolio import parse_price_values
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+PRICE_COLUMNS = ("price_low", "price_high", "price_mid")
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "pokemon_cards" not in inspector.get_table_names():
+        return
+
+    columns = {column["name"] for column in inspector.get_columns("pokemon_cards")}
+    indexes = {index["name"] for index in inspector.get_indexes("pokemon_cards")}
+
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        for name in PRICE_COLUMNS:
+            if name not in columns:
+                batch_op.add_column(sa.Column(name, sa.Float(), nullable=True))
+    for name in PRICE_COLUMNS:
+        if f"ix_pokemon_cards_{name}" not in indexes:
+            op.create_index(f"ix_pokemon_cards_{name}", "pokemon_cards", [name])
+
+    cards = sa.table(
+        "pokemon_cards",
+        sa.column("id", sa.Integer),
+        sa.column("estimated_price", sa.String),
+        sa.column("price_low", sa.Float),
+        sa.column("price_high", sa.Float),
+        sa.column("price_mid", sa.Float),
+    )
+    rows = bind.execute(
+        sa.select(cards.c.id, cards.c.estimated_price).where(cards.c.price_mid.is_(None))
+    ).all()
+    updates = []
+    for card_id, estimated_price in rows:
+        low, high, mid = parse_price_values(estimated_price or "")
+        if mid is not None:
+            updates.append({"card_id": card_id, "low": low, "high": high, "mid": mid})
+
+    if updates:
+        # executemany: one statement, many parameter sets
+        bind.execute(
+            cards.update().where(cards.c.id == sa.bindparam("card_id")).values(
+                price_low=sa.bindparam("low"),
+                price_high=sa.bindparam("high"),
+                price_mid=sa.bindparam("mid"),
+            ),
+            updates
+        )
+
+
+def downgrade():
+    for name in PRICE_COLUMNS:
+        op.drop_index(f"ix_pokemon_cards_{name}", table_name="pokemon_cards")
+    with op.batch_alter_table("pokemon_cards") as batch_op:
+        for name in PRICE_COLUMNS:
+            batch_op.drop_column(name)
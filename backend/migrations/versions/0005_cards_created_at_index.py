@@ -0,0 +1,31 @@
+"""Add composite (created_at, id) index on pokemon_cards
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "pokemon_cards" not in inspector.get_table_names():
+        return
+
+    indexes = {index["name"] for index in inspector.get_indexes("pokemon_cards")}
+    if "ix_pokemon_cards_created_at_id" not in indexes:
+        op.create_index(
+            "ix_pokemon_cards_created_at_id",
+            "pokemon_cards",
+            ["created_at", "id"]
+        )
+
+
+def downgrade():
+    op.drop_index("ix_pokemon_cards_created_at_id", table_name="pokemon_cards")
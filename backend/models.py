@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, String, Float, Text,
-    DateTime, LargeBinary, ForeignKey, Boolean
+    DateTime, ForeignKey, Boolean, BigInteger, Index
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
@@ -11,12 +11,24 @@ Base = declarative_base()
 
 class PokemonCard(Base):
     __tablename__ = "pokemon_cards"
+    __table_args__ = (
+        # Serves the newest-first keyset pagination of /cards
+        Index("ix_pokemon_cards_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     card_name = Column(String(255), nullable=False)
     estimated_price = Column(String(100), nullable=False)
+    # Numeric values parsed from estimated_price when it is written
+    price_low = Column(Float, nullable=True, index=True)
+    price_high = Column(Float, nullable=True, index=True)
+    price_mid = Column(Float, nullable=True, index=True)
     details = Column(Text, nullable=True)
-    image_data = Column(LargeBinary, nullable=True)
+    # SHA-256 of the image in the on-disk image store (see image_store.py)
+    image_sha256 = Column(String(64), nullable=True, index=True)
+    image_size = Column(Integer, nullable=True)
+    # MIME type sniffed from the image bytes when it was saved
+    image_content_type = Column(String(100), nullable=True)
     image_filename = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -62,6 +74,10 @@ class PokemonCard(Base):
 
 class PriceHistory(Base):
     __tablename__ = "price_history"
+    __table_args__ = (
+        # Serves "latest price at or before a date" lookups per card
+        Index("ix_price_history_card_id_recorded_at", "card_id", "recorded_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     card_id = Column(
@@ -77,3 +93,119 @@ class PriceHistory(Base):
 
     # Relationship back to card
     card = relationship("PokemonCard", back_populates="price_history")
+
+
+class AnalysisFingerprint(Base):
+    __tablename__ = "analysis_fingerprints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 64-bit perceptual hash of the uploaded image (stored signed)
+    image_hash = Column(BigInteger, nullable=False, index=True)
+    # Identification and grading found for this image (prices are resolved on every upload)
+    analysis_json = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    bands = relationship(
+        "FingerprintBand",
+        back_populates="fingerprint",
+        cascade="all, delete-orphan"
+    )
+
+
+class FingerprintBand(Base):
+    """One 8-bit slice of a fingerprint, indexed for near-duplicate lookup"""
+    __tablename__ = "fingerprint_bands"
+    __table_args__ = (
+        Index("ix_fingerprint_bands_band_value", "band", "value"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    fingerprint_id = Column(
+        Integer,
+        ForeignKey("analysis_fingerprints.id"),
+        nullable=False,
+        index=True
+    )
+    band = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False)
+
+    fingerprint = relationship("AnalysisFingerprint", back_populates="bands")
+
+
+class PortfolioSnapshot(Base):
+    """Running portfolio totals: one "current" row plus one closing row per day"""
+    __tablename__ = "portfolio_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "current" or a UTC date as "YYYY-MM-DD"
+    bucket = Column(String(10), nullable=False, unique=True)
+    total_value = Column(Float, nullable=False, default=0.0)
+    total_cards = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class PriceRefreshRun(Base):
+    """One pass of the background market-price refresh, checkpointed after every batch"""
+    __tablename__ = "price_refresh_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Null while the run is in progress (or was interrupted and will be resumed)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Cards are refreshed in id order; the next batch starts after this id
+    last_card_id = Column(Integer, nullable=False, default=0)
+    total_cards = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    not_found = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # Time spent refreshing, summed across resumes
+    duration_seconds = Column(Float, nullable=False, default=0.0)
+
+
+class ImportJob(Base):
+    """A bulk collection import (ZIP of card images or CSV of cards) and its progress"""
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "zip" or "csv"
+    kind = Column(String(10), nullable=False)
+    filename = Column(String(255), nullable=True)
+    # Uploaded file spooled to disk (removed once the import finishes)
+    spool_path = Column(String(500), nullable=True)
+    # "queued", "running", "done" or "failed"
+    status = Column(String(20), nullable=False, default="queued")
+    total_items = Column(Integer, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # JSON list of the first failures: [{"item": ..., "error": ...}]
+    failures_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AnalysisJob(Base):
+    """A queued `/analyze-card?async=true` request; the upload lives in the image store"""
+    __tablename__ = "analysis_jobs"
+
+    # Random hex id so job results can't be enumerated
+    id = Column(String(32), primary_key=True)
+    filename = Column(String(255), nullable=True)
+    image_sha256 = Column(String(64), nullable=False, index=True)
+    force = Column(Boolean, nullable=False, default=False)
+    # "queued", "running", "done" or "failed"
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Earliest time a retried job may run again
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    # CardAnalysisResponse as JSON once the job is done
+    result_json = Column(Text, nullable=True)
+    # Re-upload cache status of the analysis ("hit", "miss" or null)
+    cache_status = Column(String(10), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
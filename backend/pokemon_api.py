@@ -1,16 +1,204 @@
 """
 Pokemon Price Tracker API Integration
 """
+import asyncio
 import httpx
+import json
 import os
-from typing import Optional, Dict, Any, List
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
+from singleflight import SingleFlight
 
 load_dotenv()
 
 POKEMON_API_KEY = os.getenv("POKEMON_API_KEY")
 BASE_URL = "https://www.pokemonpricetracker.com/api/v2"
 
+# Connection pool settings for the shared HTTP client
+POKEMON_API_TIMEOUT = float(os.getenv("POKEMON_API_TIMEOUT", "30.0"))
+POKEMON_API_CONNECT_TIMEOUT = float(os.getenv("POKEMON_API_CONNECT_TIMEOUT", "10.0"))
+POKEMON_API_MAX_CONNECTIONS = int(os.getenv("POKEMON_API_MAX_CONNECTIONS", "20"))
+POKEMON_API_MAX_KEEPALIVE = int(os.getenv("POKEMON_API_MAX_KEEPALIVE", "10"))
+POKEMON_API_KEEPALIVE_EXPIRY = float(os.getenv("POKEMON_API_KEEPALIVE_EXPIRY", "30.0"))
+POKEMON_API_HTTP2 = os.getenv("POKEMON_API_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Market data cache settings (TTL of 0 disables the cache)
+POKEMON_API_CACHE_TTL = float(os.getenv("POKEMON_API_CACHE_TTL", "3600"))
+POKEMON_API_CACHE_STALE_TTL = float(os.getenv("POKEMON_API_CACHE_STALE_TTL", "86400"))
+POKEMON_API_CACHE_MAX_ENTRIES = int(os.getenv("POKEMON_API_CACHE_MAX_ENTRIES", "1024"))
+# Path to a SQLite file for the persistent cache tier (empty disables it)
+POKEMON_API_CACHE_DB = os.getenv("POKEMON_API_CACHE_DB", "")
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class MarketDataCache:
+    """
+    TTL + LRU cache for Pokemon API responses with an optional SQLite tier
+    
+    Entries younger than `ttl` are fresh. Entries between `ttl` and
+    `ttl + stale_ttl` are stale: they are still served, but the caller is
+    expected to revalidate them in the background. Older entries are dropped.
+    SQLite reads and writes run in a worker thread so a slow disk or a locked
+    cache file never blocks the event loop.
+    """
+    
+    def __init__(
+        self,
+        ttl: float = POKEMON_API_CACHE_TTL,
+        stale_ttl: float = POKEMON_API_CACHE_STALE_TTL,
+        max_entries: int = POKEMON_API_CACHE_MAX_ENTRIES,
+        db_path: str = POKEMON_API_CACHE_DB,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        # One connection shared by worker threads; statements must not interleave
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self.evictions = 0
+        
+        if self.enabled and db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS market_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            # Drop rows that are too old to be served even as stale
+            self._db.execute(
+                "DELETE FROM market_cache WHERE stored_at < ?",
+                (time.time() - self.ttl - self.stale_ttl,)
+            )
+            self._db.commit()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+    
+    @staticmethod
+    def make_key(path: str, params: Dict[str, Any]) -> str:
+        """Build a cache key from the endpoint and normalized query params"""
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, str):
+                value = re.sub(r"\s+", " ", value.strip().lower())
+            normalized[name] = value
+        return f"{path}?{json.dumps(normalized, sort_keys=True)}"
+    
+    async def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        Look up a cached response
+        
+        Returns:
+            (value, state) where state is "fresh", "stale" or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = await asyncio.to_thread(self._load_persistent, key)
+            if entry is not None:
+                self.persistent_hits += 1
+                self._put(key, *entry)
+        
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value, "fresh"
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return value, "stale"
+            self._entries.pop(key, None)
+        
+        self.misses += 1
+        return None, None
+    
+    async def set(self, key: str, value: Any):
+        stored_at = time.time()
+        self._put(key, value, stored_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._store_persistent, key, value, stored_at)
+    
+    def _put(self, key: str, value: Any, stored_at: float):
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _load_persistent(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Read one entry from the SQLite tier (blocking - run it in a thread)"""
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, stored_at FROM market_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+    
+    def _store_persistent(self, key: str, value: Any, stored_at: float):
+        """Write one entry to the SQLite tier (blocking - run it in a thread)"""
+        payload = json.dumps(value)
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO market_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, payload, stored_at)
+            )
+            self._db.commit()
+    
+    def clear(self):
+        self._entries.clear()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM market_cache")
+                self._db.commit()
+    
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "persistent": self._db is not None,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "persistent_hits": self.persistent_hits,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
 
 class PokemonPriceAPI:
     """Client for Pokemon Price Tracker API"""
@@ -22,6 +210,146 @@ class PokemonPriceAPI:
             "Authorization": f"Bearer {self.api_key}" if self.api_key else "",
             "Content-Type": "application/json"
         }
+        self.http2 = POKEMON_API_HTTP2 and _http2_available()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests_sent = 0
+        self._request_errors = 0
+        self.cache = MarketDataCache()
+        self._flights = SingleFlight("pokemon_api")
+        self._revalidations: Dict[str, asyncio.Task] = {}
+    
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            http2=self.http2,
+            timeout=httpx.Timeout(POKEMON_API_TIMEOUT, connect=POKEMON_API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=POKEMON_API_MAX_CONNECTIONS,
+                max_keepalive_connections=POKEMON_API_MAX_KEEPALIVE,
+                keepalive_expiry=POKEMON_API_KEEPALIVE_EXPIRY,
+            ),
+        )
+    
+    async def start(self):
+        """Open the shared, pooled HTTP client (called on app startup)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+            if POKEMON_API_HTTP2 and not self.http2:
+                print("⚠️  POKEMON_API_HTTP2 is set but `h2` is not installed - using HTTP/1.1")
+    
+    async def close(self):
+        """Close the shared HTTP client and its pooled connections (called on app shutdown)"""
+        for task in self._revalidations.values():
+            task.cancel()
+        self._revalidations.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.cache.close()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Lazily open the client so the API also works outside the FastAPI lifecycle
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+    
+    async def _get(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Issue a GET against the API over the pooled client
+        
+        Raises:
+            httpx.HTTPError: on transport errors or non-2xx responses
+        """
+        self._requests_sent += 1
+        try:
+            response = await self.client.get(path, params=params)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError:
+            self._request_errors += 1
+            raise
+    
+    async def _cached_get(self, path: str, params: Dict[str, Any], fresh: bool = False) -> Dict[str, Any]:
+        """
+        GET through the market data cache
+        
+        Fresh hits skip the network entirely. Concurrent misses for the same
+        key are coalesced into a single request. Stale hits are served immediately
+        while a background request refreshes the entry. Errors are never cached.
+        With `fresh=True` the cache is not read, but the response still updates it.
+        """
+        key = self.cache.make_key(path, params)
+        if not self.cache.enabled:
+            return await self._flights.do(key, lambda: self._get(path, params))
+        if fresh:
+            return await self._flights.do(key, lambda: self._fetch_and_store(key, path, params))
+        
+        value, state = await self.cache.get(key)
+        if state == "stale":
+            self._schedule_revalidation(key, path, params)
+        if state is not None:
+            return value
+        
+        # Concurrent misses for the same lookup share one upstream request
+        return await self._flights.do(key, lambda: self._fetch_and_store(key, path, params))
+    
+    async def _fetch_and_store(self, key: str, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        data = await self._get(path, params)
+        await self.cache.set(key, data)
+        return data
+    
+    def _schedule_revalidation(self, key: str, path: str, params: Dict[str, Any]):
+        if key in self._revalidations:
+            return
+        
+        async def revalidate():
+            try:
+                await self.cache.set(key, await self._get(path, params))
+            except httpx.HTTPError as e:
+                print(f"Error revalidating cached market data: {e}")
+            finally:
+                self._revalidations.pop(key, None)
+        
+        self._revalidations[key] = asyncio.create_task(revalidate())
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Report market data cache counters for tuning TTL and size
+        
+        Returns:
+            Dictionary with cache settings, size and hit/miss counters
+        """
+        return {**self.cache.stats(), "revalidating": len(self._revalidations)}
+    
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Report how many lookups joined an identical request already in flight"""
+        return self._flights.stats()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Report connection pool usage for the shared HTTP client
+        
+        Returns:
+            Dictionary with pool limits, open/idle connection counts and request counters
+        """
+        connections = []
+        if self._client is not None and not self._client.is_closed:
+            pool = getattr(self._client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+        
+        return {
+            "client_open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "max_connections": POKEMON_API_MAX_CONNECTIONS,
+            "max_keepalive_connections": POKEMON_API_MAX_KEEPALIVE,
+            "keepalive_expiry": POKEMON_API_KEEPALIVE_EXPIRY,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+            "requests_sent": self._requests_sent,
+            "request_errors": self._request_errors,
+        }
     
     async def search_card(self, card_name: str, set_name: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
         """
@@ -48,19 +376,12 @@ class PokemonPriceAPI:
         if set_name:
             params["set"] = set_name
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/cards",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("data", [])
-            except httpx.HTTPError as e:
-                print(f"Error fetching card data: {e}")
-                return []
+        try:
+            data = await self._cached_get("/cards", params)
+            return data.get("data", [])
+        except httpx.HTTPError as e:
+            print(f"Error fetching card data: {e}")
+            return []
     
     async def get_card_with_history(self, card_name: str, set_name: Optional[str] = None, days: int = 30) -> Optional[Dict[str, Any]]:
         """
@@ -87,31 +408,35 @@ class PokemonPriceAPI:
         if set_name:
             params["set"] = set_name
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/cards",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                cards = data.get("data", [])
-                return cards[0] if cards else None
-            except httpx.HTTPError as e:
-                print(f"Error fetching card with history: {e}")
-                return None
+        try:
+            data = await self._cached_get("/cards", params)
+            cards = data.get("data", [])
+            return cards[0] if cards else None
+        except httpx.HTTPError as e:
+            print(f"Error fetching card with history: {e}")
+            return None
     
-    async def get_card_with_psa_data(self, card_name: str, set_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    async def get_card_with_psa_data(
+        self,
+        card_name: str,
+        set_name: Optional[str] = None,
+        fresh: bool = False,
+        raise_errors: bool = False
+    ) -> Optional[Dict[str, Any]]:
         """
         Get card data with PSA grading information
         
         Args:
             card_name: Name of the card
             set_name: Optional set name
+            fresh: Bypass cached market data (the result still refreshes the cache)
+            raise_errors: Raise upstream failures instead of reporting them as "not found"
             
         Returns:
             Card data with PSA info, or None if not found
+        
+        Raises:
+            httpx.HTTPError: with raise_errors, on transport errors or non-2xx responses
         """
         if not self.api_key:
             raise ValueError("Pokemon API key not configured")
@@ -126,20 +451,15 @@ class PokemonPriceAPI:
         if set_name:
             params["set"] = set_name
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/cards",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                cards = data.get("data", [])
-                return cards[0] if cards else None
-            except httpx.HTTPError as e:
-                print(f"Error fetching card with PSA data: {e}")
-                return None
+        try:
+            data = await self._cached_get("/cards", params, fresh=fresh)
+            cards = data.get("data", [])
+            return cards[0] if cards else None
+        except httpx.HTTPError as e:
+            if raise_errors:
+                raise
+            print(f"Error fetching card with PSA data: {e}")
+            return None
     
     async def get_all_sets(self, search: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -158,19 +478,12 @@ class PokemonPriceAPI:
         if search:
             params["search"] = search
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/sets",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("data", [])
-            except httpx.HTTPError as e:
-                print(f"Error fetching sets: {e}")
-                return []
+        try:
+            data = await self._cached_get("/sets", params)
+            return data.get("data", [])
+        except httpx.HTTPError as e:
+            print(f"Error fetching sets: {e}")
+            return []
     
     def format_price_data(self, card_data: Dict[str, Any]) -> Dict[str, Any]:
         """
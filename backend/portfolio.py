@@ -0,0 +1,155 @@
+"""
+Incrementally maintained portfolio value snapshots
+
+Every write that changes the collection's value applies a delta to the
+"current" snapshot row and copies the result into today's daily bucket, so
+analytics and the value-over-time chart read a few rows instead of re-parsing
+every card's price.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import PokemonCard, PortfolioSnapshot
+
+CURRENT_BUCKET = "current"
+
+
+def parse_price_values(price_str: str) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """
+    Parse price string like '$50 - $100' or '$75' into (low, high, mid)
+
+    mid is the average of every number found (the single value if not a range).
+    All three are None when the string has no numbers (e.g. "Price unavailable").
+    """
+    # Remove currency symbols and extract numbers
+    numbers = re.findall(r'[\d,]+\.?\d*', price_str.replace(',', ''))
+
+    if not numbers:
+        return None, None, None
+
+    # Convert to floats
+    prices = [float(num) for num in numbers]
+    return min(prices), max(prices), sum(prices) / len(prices)
+
+
+def parse_price_string(price_str: str) -> float:
+    """Parse price string like '$50 - $100' or '$75' and return average or single value"""
+    return parse_price_values(price_str)[2] or 0.0
+
+
+def set_card_price(card: PokemonCard, price_str: str):
+    """Set a card's display price and its parsed numeric columns together"""
+    card.estimated_price = price_str
+    card.price_low, card.price_high, card.price_mid = parse_price_values(price_str)
+
+
+def _today_bucket() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _record_daily_bucket(db: Session, current: PortfolioSnapshot):
+    bucket = _today_bucket()
+    daily = db.query(PortfolioSnapshot).filter(PortfolioSnapshot.bucket == bucket).first()
+    if daily is None:
+        daily = PortfolioSnapshot(bucket=bucket)
+        db.add(daily)
+    daily.total_value = current.total_value
+    daily.total_cards = current.total_cards
+
+
+def rebuild_portfolio_snapshot(db: Session) -> PortfolioSnapshot:
+    """
+    Recompute the current snapshot from the cards table (bootstrap / drift repair)
+
+    Does not commit; the caller owns the transaction.
+    """
+    total_cards, total_value = db.query(
+        func.count(PokemonCard.id),
+        func.coalesce(func.sum(PokemonCard.price_mid), 0.0)
+    ).one()
+
+    current = db.query(PortfolioSnapshot).filter(
+        PortfolioSnapshot.bucket == CURRENT_BUCKET).first()
+    if current is None:
+        current = PortfolioSnapshot(bucket=CURRENT_BUCKET)
+        db.add(current)
+    current.total_value = total_value
+    current.total_cards = total_cards
+
+    _record_daily_bucket(db, current)
+    return current
+
+
+def apply_portfolio_delta(db: Session, value_delta: float, card_delta: int = 0) -> PortfolioSnapshot:
+    """
+    Adjust the running totals after a card is added, repriced or removed
+
+    Does not commit, so the snapshot update lands in the same transaction as
+    the card change.
+
+    Args:
+        db: Database session
+        value_delta: Change in total collection value
+        card_delta: Change in number of cards
+    """
+    current = db.query(PortfolioSnapshot).filter(
+        PortfolioSnapshot.bucket == CURRENT_BUCKET).first()
+    if current is None:
+        # First write since the table was created: the card change is already
+        # flushed, so a full rebuild includes it
+        db.flush()
+        return rebuild_portfolio_snapshot(db)
+
+    # Increment in SQL so concurrent writers don't overwrite each other
+    db.query(PortfolioSnapshot).filter(PortfolioSnapshot.id == current.id).update({
+        PortfolioSnapshot.total_value: PortfolioSnapshot.total_value + value_delta,
+        PortfolioSnapshot.total_cards: PortfolioSnapshot.total_cards + card_delta,
+    }, synchronize_session=False)
+    db.refresh(current)
+
+    _record_daily_bucket(db, current)
+    return current
+
+
+def get_current_snapshot(db: Session) -> PortfolioSnapshot:
+    current = db.query(PortfolioSnapshot).filter(
+        PortfolioSnapshot.bucket == CURRENT_BUCKET).first()
+    if current is None:
+        current = rebuild_portfolio_snapshot(db)
+        db.commit()
+    return current
+
+
+def portfolio_history(db: Session, days: int) -> List[Dict[str, Any]]:
+    """Daily closing totals for the last `days` days, oldest first"""
+    since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+    rows = db.query(PortfolioSnapshot).filter(
+        PortfolioSnapshot.bucket != CURRENT_BUCKET,
+        PortfolioSnapshot.bucket >= since
+    ).order_by(PortfolioSnapshot.bucket).all()
+    return [
+        {"date": row.bucket, "total_value": row.total_value, "total_cards": row.total_cards}
+        for row in rows
+    ]
+
+
+def portfolio_values_days_ago(db: Session, days_ago: List[int]) -> List[float]:
+    """
+    Closing total value of the collection `n` days ago, for each n
+
+    Uses the latest daily bucket on or before that date, so days without writes
+    carry the previous close forward. 0.0 when no snapshot is that old.
+    """
+    today = datetime.utcnow()
+    closes = [
+        db.query(PortfolioSnapshot.total_value).filter(
+            PortfolioSnapshot.bucket != CURRENT_BUCKET,
+            PortfolioSnapshot.bucket <= (today - timedelta(days=days)).strftime("%Y-%m-%d")
+        ).order_by(PortfolioSnapshot.bucket.desc()).limit(1).scalar_subquery()
+        for days in days_ago
+    ]
+    return [value or 0.0 for value in db.query(*closes).one()]
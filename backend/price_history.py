@@ -0,0 +1,187 @@
+"""
+Range-bounded, downsampled price history for charts
+
+A card refreshed daily for years has thousands of PriceHistory rows, but a chart
+only needs a few hundred points. The requested range is split into at most
+`max_points` equal-width time buckets and each bucket is reduced to one OHLC
+point in SQL, so the payload size stays fixed however long the history gets and
+the points stay evenly spaced on a time axis.
+
+Bulk price writes (the background refresh and `/cards/prices:bulk`) go through
+`bulk_set_prices`, which updates many cards in one transaction.
+"""
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Integer, case, cast, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import IS_SQLITE
+from models import PokemonCard, PriceHistory
+from portfolio import apply_portfolio_delta, parse_price_values
+
+# Default and upper bound for points returned by /cards/{card_id}/price-history
+PRICE_HISTORY_MAX_POINTS = int(os.getenv("PRICE_HISTORY_MAX_POINTS", "500"))
+PRICE_HISTORY_MAX_POINTS_LIMIT = int(os.getenv("PRICE_HISTORY_MAX_POINTS_LIMIT", "5000"))
+
+
+def _epoch_seconds(value: datetime) -> float:
+    # SQLite hands back naive datetimes; every stored time is UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def downsampled_price_history(
+    db: Session,
+    card_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_points: int = PRICE_HISTORY_MAX_POINTS
+) -> List[Dict[str, Any]]:
+    """
+    Price history of a card reduced to at most `max_points` OHLC points
+
+    The range from `start` to `end` (or the first/last recorded row when not
+    given) is cut into `max_points` buckets of equal duration. Empty buckets
+    produce no point, and a bucket holding a single row has
+    open = high = low = close.
+
+    Args:
+        db: Database session
+        card_id: Card whose history to read
+        start: Only include rows recorded at or after this time
+        end: Only include rows recorded at or before this time
+        max_points: Maximum number of points returned
+
+    Returns:
+        Points newest first; `price`, `price_display`, `recorded_at` and `id`
+        come from the last row of each bucket (the close)
+    """
+    filters = [PriceHistory.card_id == card_id]
+    if start is not None:
+        filters.append(PriceHistory.recorded_at >= start)
+    if end is not None:
+        filters.append(PriceHistory.recorded_at <= end)
+
+    if start is None or end is None:
+        first_at, last_at = db.execute(
+            select(func.min(PriceHistory.recorded_at), func.max(PriceHistory.recorded_at)).where(*filters)
+        ).one()
+        if first_at is None:
+            return []
+        start = start if start is not None else first_at
+        end = end if end is not None else last_at
+
+    start_epoch = _epoch_seconds(start)
+    # Guard against a zero-width range (a single row, or from == to)
+    width = max((_epoch_seconds(end) - start_epoch) / max_points, 1e-6)
+
+    if IS_SQLITE:
+        # Rows are never before `start`, so truncating toward zero is floor()
+        recorded_epoch = (func.julianday(PriceHistory.recorded_at) - 2440587.5) * 86400
+        raw_bucket = cast((recorded_epoch - start_epoch) / width, Integer)
+    else:
+        recorded_epoch = func.extract("epoch", PriceHistory.recorded_at)
+        raw_bucket = cast(func.floor((recorded_epoch - start_epoch) / width), Integer)
+    # A row exactly at `end` would land one past the last bucket
+    bucket = case((raw_bucket >= max_points, max_points - 1), else_=raw_bucket)
+
+    bucketed = select(
+        PriceHistory.id,
+        PriceHistory.price,
+        PriceHistory.price_display,
+        PriceHistory.recorded_at,
+        bucket.label("bucket"),
+    ).where(*filters).subquery()
+
+    # Open/close of each bucket, repeated on every row of the bucket
+    oldest_first = (bucketed.c.recorded_at, bucketed.c.id)
+    newest_first = (bucketed.c.recorded_at.desc(), bucketed.c.id.desc())
+    ranked = select(
+        bucketed.c.bucket,
+        bucketed.c.price,
+        func.first_value(bucketed.c.price).over(
+            partition_by=bucketed.c.bucket, order_by=oldest_first).label("open"),
+        func.first_value(bucketed.c.price).over(
+            partition_by=bucketed.c.bucket, order_by=newest_first).label("close"),
+        func.first_value(bucketed.c.price_display).over(
+            partition_by=bucketed.c.bucket, order_by=newest_first).label("close_display"),
+        func.first_value(bucketed.c.recorded_at, type_=PriceHistory.recorded_at.type).over(
+            partition_by=bucketed.c.bucket, order_by=newest_first).label("close_at"),
+        func.first_value(bucketed.c.id).over(
+            partition_by=bucketed.c.bucket, order_by=newest_first).label("close_id"),
+    ).subquery()
+
+    points = select(
+        func.max(ranked.c.close_id).label("id"),
+        func.max(ranked.c.open).label("open"),
+        func.max(ranked.c.price).label("high"),
+        func.min(ranked.c.price).label("low"),
+        func.max(ranked.c.close).label("close"),
+        func.max(ranked.c.close_display).label("price_display"),
+        func.max(ranked.c.close_at).label("recorded_at"),
+        func.count().label("samples"),
+    ).group_by(ranked.c.bucket).order_by(ranked.c.bucket.desc())
+
+    return [
+        {
+            "id": row.id,
+            "card_id": card_id,
+            "price": row.close,
+            "price_display": row.price_display,
+            "recorded_at": row.recorded_at,
+            "open": row.open,
+            "high": row.high,
+            "low": row.low,
+            "samples": row.samples,
+        }
+        for row in db.execute(points)
+    ]
+
+
+def bulk_set_prices(db: Session, updates: List[Dict[str, Any]]) -> float:
+    """
+    Set many cards' prices with one bulk UPDATE and one multi-row INSERT into price_history
+
+    Does not commit; the caller owns the transaction. Ids of cards that no
+    longer exist are skipped.
+
+    Args:
+        db: Database session
+        updates: One dict per card with "id" and "estimated_price", plus any
+            other PokemonCard columns to set (e.g. "market_price")
+
+    Returns:
+        Change in total collection value (already applied to the portfolio snapshot)
+    """
+    if not updates:
+        return 0.0
+
+    old_values = dict(db.query(PokemonCard.id, PokemonCard.price_mid).filter(
+        PokemonCard.id.in_([item["id"] for item in updates])).all())
+
+    card_rows = []
+    history_rows = []
+    value_delta = 0.0
+    for item in updates:
+        if item["id"] not in old_values:
+            continue
+        low, high, mid = parse_price_values(item["estimated_price"])
+        card_rows.append({**item, "price_low": low, "price_high": high, "price_mid": mid})
+        history_rows.append({
+            "card_id": item["id"],
+            "price": mid or 0.0,
+            "price_display": item["estimated_price"],
+        })
+        value_delta += (mid or 0.0) - (old_values.get(item["id"]) or 0.0)
+
+    if not card_rows:
+        return 0.0
+
+    # executemany: UPDATE by primary key and INSERT, one statement each
+    db.execute(update(PokemonCard), card_rows)
+    db.execute(insert(PriceHistory), history_rows)
+    apply_portfolio_delta(db, value_delta)
+    return value_delta
@@ -0,0 +1,415 @@
+"""
+Background market-price refresh
+
+Without it prices only change when someone calls `/cards/{card_id}/update-price`,
+so PriceHistory stays sparse and the analytics deltas are mostly zero. The
+refresher re-prices the whole collection through the Pokemon API on a fixed
+cadence. Lookups run with bounded concurrency behind a token-bucket rate limit,
+and every batch of cards is written in one transaction (bulk UPDATE of the
+cards and bulk INSERT into price_history via price_history.bulk_set_prices)
+together with a checkpoint, so an interrupted run resumes where it stopped
+after a restart. When the API rate limits us or keeps failing, the batch is
+dropped without moving the checkpoint and the run resumes after a pause.
+Database work runs in worker threads so a locked database never stalls the
+event loop.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import PokemonCard, PriceRefreshRun
+from pokemon_api import pokemon_api
+from price_history import bulk_set_prices
+
+# Seconds between the end of one refresh and the start of the next (0 disables the scheduler)
+PRICE_REFRESH_INTERVAL = float(os.getenv("PRICE_REFRESH_INTERVAL", "86400"))
+# Max Pokemon API lookups in flight at once
+PRICE_REFRESH_CONCURRENCY = int(os.getenv("PRICE_REFRESH_CONCURRENCY", "4"))
+# Sustained lookups per second and the burst allowed on top of it
+PRICE_REFRESH_RATE = float(os.getenv("PRICE_REFRESH_RATE", "1.0"))
+PRICE_REFRESH_BURST = int(os.getenv("PRICE_REFRESH_BURST", "5"))
+# Cards written (and checkpointed) per transaction
+PRICE_REFRESH_BATCH_SIZE = int(os.getenv("PRICE_REFRESH_BATCH_SIZE", "100"))
+# Consecutive failed lookups that abort the current batch (a 429 aborts it at once)
+PRICE_REFRESH_MAX_ERRORS = int(os.getenv("PRICE_REFRESH_MAX_ERRORS", "5"))
+# Seconds to wait before resuming an aborted run
+PRICE_REFRESH_RETRY_DELAY = float(os.getenv("PRICE_REFRESH_RETRY_DELAY", "600"))
+
+
+class RefreshAborted(Exception):
+    """The Pokemon API is failing or rate limiting; the batch was not checkpointed"""
+
+
+class _BatchState:
+    """Tracks upstream errors within one batch and signals its lookups to stop"""
+
+    def __init__(self, max_errors: int):
+        self.max_errors = max(1, max_errors)
+        self.consecutive_errors = 0
+        self.abort = asyncio.Event()
+        self.reason: Optional[str] = None
+
+    def record_success(self):
+        self.consecutive_errors = 0
+
+    def record_error(self, error: Exception):
+        self.consecutive_errors += 1
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+            self.reason = "rate limited by the Pokemon API (429)"
+        elif self.consecutive_errors >= self.max_errors:
+            self.reason = f"{self.consecutive_errors} lookups failed in a row (last: {error})"
+        else:
+            return
+        self.abort.set()
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # The lock makes waiters take tokens in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _display_price(card_data: Dict[str, Any]) -> Optional[Tuple[str, Optional[float]]]:
+    """(estimated_price string, market price) from API card data, like /analyze-card stores them"""
+    price_info = pokemon_api.format_price_data(card_data)
+    if price_info["market_price"]:
+        return f"${price_info['market_price']:.2f}", price_info["market_price"]
+    if price_info["price_range"]:
+        return price_info["price_range"], None
+    return None
+
+
+def _run_stats(run: Optional[PriceRefreshRun]) -> Optional[Dict[str, Any]]:
+    if run is None:
+        return None
+    return {
+        "id": run.id,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "total_cards": run.total_cards,
+        "processed": run.processed,
+        "updated": run.updated,
+        "not_found": run.not_found,
+        "failed": run.failed,
+        "progress": round(run.processed / run.total_cards, 4) if run.total_cards else 1.0,
+        "duration_seconds": round(run.duration_seconds, 3),
+    }
+
+
+class PriceRefresher:
+    """Schedules and runs collection-wide price refreshes"""
+
+    def __init__(
+        self,
+        interval: float = PRICE_REFRESH_INTERVAL,
+        concurrency: int = PRICE_REFRESH_CONCURRENCY,
+        rate: float = PRICE_REFRESH_RATE,
+        burst: int = PRICE_REFRESH_BURST,
+        batch_size: int = PRICE_REFRESH_BATCH_SIZE,
+        max_errors: int = PRICE_REFRESH_MAX_ERRORS,
+        retry_delay: float = PRICE_REFRESH_RETRY_DELAY
+    ):
+        self.interval = interval
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._run_lock: Optional[asyncio.Lock] = None
+        self.running = False
+
+    def start(self):
+        """Start the scheduler loop (called on app startup)"""
+        if self.interval <= 0:
+            print("⏸️  Price refresh scheduler disabled (PRICE_REFRESH_INTERVAL=0)")
+            return
+        if not pokemon_api.api_key:
+            print("⏸️  Price refresh scheduler disabled (no Pokemon API key)")
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Cancel the scheduler; an in-progress run resumes from its checkpoint next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def trigger(self) -> bool:
+        """Start a refresh now instead of waiting for the next scheduled one"""
+        if self._wakeup is None:
+            return False
+        self._wakeup.set()
+        return True
+
+    def _seconds_until_due(self) -> float:
+        db = SessionLocal()
+        try:
+            last = db.query(PriceRefreshRun).order_by(PriceRefreshRun.id.desc()).first()
+        finally:
+            db.close()
+        if last is None or last.finished_at is None:
+            # Never ran, or the last run was interrupted: start (or resume) right away
+            return 0.0
+        finished_at = last.finished_at.replace(tzinfo=None)
+        elapsed = (datetime.utcnow() - finished_at).total_seconds()
+        return max(0.0, self.interval - elapsed)
+
+    async def _sleep(self, delay: float):
+        """Sleep until `delay` passes or a refresh is triggered"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _loop(self):
+        while True:
+            delay = await asyncio.to_thread(self._seconds_until_due)
+            if delay > 0:
+                await self._sleep(delay)
+            self._wakeup.clear()
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except RefreshAborted as e:
+                print(f"⏸️  Price refresh paused: {e}; resuming in {self.retry_delay:.0f}s")
+                await self._sleep(self.retry_delay)
+            except Exception as e:
+                print(f"❌ Price refresh failed: {e}")
+                # Don't spin on a persistent error; retry on the next wakeup or interval
+                await self._sleep(self.interval)
+
+    def _open_run(self) -> Tuple[int, int]:
+        """Resume the unfinished run or start a new one (blocking - run it in a thread)
+
+        Returns:
+            (run id, id of the last card already refreshed)
+        """
+        db = SessionLocal()
+        try:
+            run = db.query(PriceRefreshRun).filter(
+                PriceRefreshRun.finished_at.is_(None)).order_by(PriceRefreshRun.id.desc()).first()
+            if run is not None:
+                print(f"🔁 Resuming price refresh #{run.id} after card {run.last_card_id}")
+                return run.id, run.last_card_id
+
+            run = PriceRefreshRun(
+                last_card_id=0,
+                total_cards=db.query(func.count(PokemonCard.id)).scalar(),
+                processed=0,
+                updated=0,
+                not_found=0,
+                failed=0,
+                duration_seconds=0.0,
+            )
+            db.add(run)
+            db.commit()
+            print(f"🔄 Starting price refresh #{run.id} for {run.total_cards} cards")
+            return run.id, run.last_card_id
+        finally:
+            db.close()
+
+    def _next_cards(self, after_card_id: int) -> List[Tuple[int, str, Optional[str]]]:
+        """Next batch of cards in id order (blocking - run it in a thread)"""
+        db = SessionLocal()
+        try:
+            return [
+                (card.id, card.card_name, card.set_name)
+                for card in db.query(
+                    PokemonCard.id, PokemonCard.card_name, PokemonCard.set_name
+                ).filter(PokemonCard.id > after_card_id).order_by(
+                    PokemonCard.id).limit(self.batch_size)
+            ]
+        finally:
+            db.close()
+
+    async def _lookup(
+        self,
+        card: Tuple[int, str, Optional[str]],
+        semaphore: asyncio.Semaphore,
+        bucket: TokenBucket,
+        state: _BatchState
+    ) -> Tuple[int, str, Optional[Tuple[str, Optional[float]]]]:
+        card_id, card_name, set_name = card
+        async with semaphore:
+            if state.abort.is_set():
+                return card_id, "skipped", None
+            await bucket.acquire()
+            if state.abort.is_set():
+                return card_id, "skipped", None
+            try:
+                card_data = await pokemon_api.get_card_with_psa_data(
+                    card_name, set_name, fresh=True, raise_errors=True)
+            except Exception as e:
+                print(f"   ⚠️  Price lookup failed for card {card_id}: {e}")
+                state.record_error(e)
+                return card_id, "failed", None
+        state.record_success()
+        if not card_data:
+            return card_id, "not_found", None
+        price = _display_price(card_data)
+        return card_id, ("updated" if price else "not_found"), price
+
+    async def run_once(self) -> Dict[str, Any]:
+        """
+        Refresh every card's price, resuming an interrupted run if there is one
+
+        Returns:
+            Stats of the finished run
+        """
+        if self._run_lock is None:
+            self._run_lock = asyncio.Lock()
+        async with self._run_lock:
+            self.running = True
+            try:
+                return await self._run()
+            finally:
+                self.running = False
+
+    async def _run(self) -> Dict[str, Any]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate, self.burst)
+
+        run_id, last_card_id = await asyncio.to_thread(self._open_run)
+        while True:
+            batch_started = time.perf_counter()
+            cards = await asyncio.to_thread(self._next_cards, last_card_id)
+            if not cards:
+                break
+
+            state = _BatchState(self.max_errors)
+            results = await asyncio.gather(*(
+                self._lookup(card, semaphore, bucket, state) for card in cards
+            ))
+            if state.abort.is_set():
+                # Keep the checkpoint where it is so these cards are retried on resume
+                raise RefreshAborted(state.reason)
+
+            last_card_id = cards[-1][0]
+            await asyncio.to_thread(
+                self._commit_batch, run_id, results, last_card_id, time.perf_counter() - batch_started)
+
+        return await asyncio.to_thread(self._finish_run, run_id)
+
+    def _commit_batch(
+        self,
+        run_id: int,
+        results: List[Tuple[int, str, Optional[Tuple[str, Optional[float]]]]],
+        last_card_id: int,
+        duration: float
+    ):
+        """Write a batch and move the checkpoint in one transaction (blocking - run it in a thread)"""
+        db = SessionLocal()
+        try:
+            run = db.get(PriceRefreshRun, run_id)
+            self._write_batch(db, run, results)
+            run.last_card_id = last_card_id
+            run.duration_seconds += duration
+            db.commit()
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: int) -> Dict[str, Any]:
+        """Mark a run finished (blocking - run it in a thread)"""
+        db = SessionLocal()
+        try:
+            run = db.get(PriceRefreshRun, run_id)
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            print(
+                f"✅ Price refresh #{run.id} done: {run.updated} updated, {run.not_found} not found, "
+                f"{run.failed} failed in {run.duration_seconds:.1f}s"
+            )
+            return _run_stats(run)
+        finally:
+            db.close()
+
+    def _write_batch(
+        self,
+        db: Session,
+        run: PriceRefreshRun,
+        results: List[Tuple[int, str, Optional[Tuple[str, Optional[float]]]]]
+    ):
+        """Apply one batch of lookups in the caller's transaction"""
+        updates = []
+        for card_id, status, price in results:
+            run.processed += 1
+            if status == "failed":
+                run.failed += 1
+            elif status == "not_found":
+                run.not_found += 1
+            else:
+                run.updated += 1
+                display, market_price = price
+                updates.append({
+                    "id": card_id,
+                    "estimated_price": display,
+                    "market_price": market_price,
+                    "price_source": "api",
+                })
+        bulk_set_prices(db, updates)
+
+    @staticmethod
+    def _recent_runs() -> List[PriceRefreshRun]:
+        db = SessionLocal()
+        try:
+            runs = db.query(PriceRefreshRun).order_by(PriceRefreshRun.id.desc()).limit(5).all()
+            db.expunge_all()
+            return runs
+        finally:
+            db.close()
+
+    async def stats(self) -> Dict[str, Any]:
+        runs = await asyncio.to_thread(self._recent_runs)
+        current = runs[0] if runs and runs[0].finished_at is None else None
+        finished = [run for run in runs if run.finished_at is not None]
+        return {
+            "scheduled": self._task is not None and not self._task.done(),
+            "running": self.running,
+            "interval": self.interval,
+            "concurrency": self.concurrency,
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "batch_size": self.batch_size,
+            "max_errors": self.max_errors,
+            "retry_delay": self.retry_delay,
+            "current_run": _run_stats(current),
+            "recent_runs": [_run_stats(run) for run in finished],
+        }
+
+
+# Singleton instance
+price_refresher = PriceRefresher()
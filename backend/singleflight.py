@@ -0,0 +1,62 @@
+"""
+Single-flight request coalescing for async upstream calls
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one in-flight task
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task and receive the same result (or the
+    same exception). Once the task finishes the key is released, so later
+    calls start a fresh request - nothing is cached here.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn` for `key`, or join the run already in flight
+
+        Args:
+            key: Identity of the request (callers with equal keys share work)
+            fn: Zero-argument coroutine factory that performs the request
+
+        Returns:
+            The result of the shared call
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+        else:
+            self.coalesced += 1
+
+        # Shield so one cancelled caller doesn't cancel the work for everyone else
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
@@ -0,0 +1,33 @@
+"""
+Shared test setup
+
+Backend modules read their settings from the environment at import time, so
+the database, image store and spool directories are pointed at a throwaway
+directory before anything from the backend is imported.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix="pokewealth-tests-")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}",
+    "IMAGE_STORE_DIR": os.path.join(TEST_DIR, "image_store"),
+    "IMAGE_VARIANT_DIR": os.path.join(TEST_DIR, "image_variants"),
+    "IMPORT_SPOOL_DIR": os.path.join(TEST_DIR, "import_spool"),
+    "GEMINI_API_KEY": "test-key",
+    "POKEMON_API_KEY": "",
+    "POKEMON_API_CACHE_DB": "",
+})
+sys.path.insert(0, BACKEND_DIR)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def tables():
+    """Create the schema (and stamp migrations) in the test database once"""
+    from database import create_tables
+    create_tables()
@@ -0,0 +1,69 @@
+import asyncio
+
+from PIL import UnidentifiedImageError
+
+import analysis_jobs
+from analysis import CardAnalysisResponse
+from analysis_jobs import AnalysisJobQueue
+
+RESULT = CardAnalysisResponse(card_name="Pikachu", estimated_price="$10.00", details="Base Set")
+
+
+class FlakyAnalysis:
+    """analyze_image stand-in that raises the queued errors in turn, then succeeds"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, contents, filename, db, force=False, on_progress=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return RESULT, "miss"
+
+
+def run_job(monkeypatch, fake, max_attempts=3):
+    monkeypatch.setattr(analysis_jobs, "analyze_image", fake)
+
+    async def scenario():
+        queue = AnalysisJobQueue(workers=1, max_attempts=max_attempts, retry_delay=0.01)
+        await queue.start()
+        try:
+            job = await queue.submit(b"not really an image", "card.jpg")
+            return queue.job_status(await queue.get(job.id, wait=5))
+        finally:
+            await queue.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_transient_failure_is_retried(tables, monkeypatch):
+    fake = FlakyAnalysis(RuntimeError("Gemini timed out"))
+
+    status = run_job(monkeypatch, fake)
+
+    assert status["status"] == "done"
+    assert status["attempts"] == 2
+    assert status["result"]["estimated_price"] == "$10.00"
+    assert status["error"] is None
+
+
+def test_job_fails_after_max_attempts(tables, monkeypatch):
+    fake = FlakyAnalysis(*[RuntimeError("quota exceeded")] * 5)
+
+    status = run_job(monkeypatch, fake, max_attempts=3)
+
+    assert status["status"] == "failed"
+    assert status["attempts"] == fake.calls == 3
+    assert status["error"] == "quota exceeded"
+
+
+def test_unreadable_upload_is_not_retried(tables, monkeypatch):
+    fake = FlakyAnalysis(UnidentifiedImageError("cannot identify image file <_io.BytesIO>"))
+
+    status = run_job(monkeypatch, fake)
+
+    assert status["status"] == "failed"
+    assert status["attempts"] == fake.calls == 1
+    assert status["error"] == "Upload is not a readable image"
@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import bulk_import
+import main
+from bulk_import import UploadTooLarge, _read_member, spool_upload
+
+
+def zip_with(members) -> zipfile.ZipFile:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return zipfile.ZipFile(buffer)
+
+
+def test_members_within_the_limit_are_read(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_MEMBER_BYTES", 1024)
+    archive = zip_with({"card.jpg": b"x" * 1024})
+
+    assert _read_member(archive, archive.getinfo("card.jpg")) == b"x" * 1024
+
+
+def test_oversized_member_is_reported_not_inflated(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_MEMBER_BYTES", 1024)
+    archive = zip_with({"bomb.jpg": b"\0" * (1024 * 1024)})
+
+    result = _read_member(archive, archive.getinfo("bomb.jpg"))
+
+    assert isinstance(result, ValueError)
+
+
+def test_member_whose_header_understates_its_size_is_still_capped(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_MEMBER_BYTES", 1024)
+    archive = zip_with({"bomb.jpg": b"\0" * (1024 * 1024)})
+    info = archive.getinfo("bomb.jpg")
+    info.file_size = 10
+
+    result = _read_member(archive, info)
+
+    # Reported as a failed item instead of aborting the whole import
+    assert isinstance(result, ValueError)
+
+
+def test_spool_upload_enforces_the_upload_limit(monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk_import, "IMPORT_SPOOL_DIR", tmp_path)
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_UPLOAD_BYTES", 100)
+
+    with pytest.raises(UploadTooLarge):
+        spool_upload(io.BytesIO(b"x" * 101), "cards.csv")
+    assert list(tmp_path.iterdir()) == []
+
+    path = spool_upload(io.BytesIO(b"x" * 100), "cards.csv")
+    assert path.read_bytes() == b"x" * 100
+
+
+def test_import_with_oversized_content_length_is_rejected_before_parsing(monkeypatch):
+    monkeypatch.setattr(main, "IMPORT_MAX_UPLOAD_BYTES", 100)
+    monkeypatch.setattr(main, "IMPORT_FORM_OVERHEAD", 0)
+
+    response = TestClient(main.app).post(
+        "/import",
+        files={"file": ("cards.csv", b"x" * 1000, "text/csv")},
+        headers={"Origin": "http://localhost:3000"},
+    )
+
+    assert response.status_code == 413
+    # CORS still applies so the browser can show the error
+    assert response.headers["access-control-allow-origin"] == "*"
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from database import SessionLocal
+from models import PokemonCard
+
+# Several cards share each timestamp, as bulk imports produce
+TIMESTAMPS = [datetime(2024, 1, 1, 12, 0, 0), datetime(2024, 1, 2, 12, 0, 0), datetime(2024, 1, 3, 12, 0, 0)]
+CARDS_PER_TIMESTAMP = 4
+
+
+@pytest.fixture
+def cards(tables):
+    db = SessionLocal()
+    try:
+        db.query(PokemonCard).delete()
+        for created_at in TIMESTAMPS:
+            for index in range(CARDS_PER_TIMESTAMP):
+                db.add(PokemonCard(
+                    card_name=f"Card {created_at:%d}-{index}",
+                    estimated_price="$1.00",
+                    price_mid=1.0,
+                    created_at=created_at,
+                ))
+        db.commit()
+        # Newest first, ties broken by id
+        yield [card.id for card in db.query(PokemonCard).order_by(
+            PokemonCard.created_at.desc(), PokemonCard.id.desc())]
+    finally:
+        db.query(PokemonCard).delete()
+        db.commit()
+        db.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def _all_pages(client, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit, "fields": "id"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/cards", params=params)
+        assert response.status_code == 200
+        page = [card["id"] for card in response.json()]
+        assert len(page) <= limit
+        ids.extend(page)
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return ids, pages
+        # A cursor that doesn't advance would page forever
+        assert pages <= len(TIMESTAMPS) * CARDS_PER_TIMESTAMP
+
+
+@pytest.mark.parametrize("limit", [1, 3, 5, 12, 50])
+def test_pages_cover_every_card_once_across_tied_timestamps(cards, client, limit):
+    ids, pages = _all_pages(client, limit)
+
+    assert ids == cards
+    assert pages == max(1, -(-len(cards) // limit))
+
+
+def test_without_limit_or_cursor_returns_everything_unpaginated(cards, client):
+    response = client.get("/cards")
+
+    assert [card["id"] for card in response.json()] == cards
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_cursor_without_limit_uses_the_default_page_size(cards, client, monkeypatch):
+    monkeypatch.setattr(main, "CARDS_PAGE_SIZE", 5)
+    first = client.get("/cards", params={"limit": 5})
+
+    second = client.get("/cards", params={"cursor": first.headers["X-Next-Cursor"]})
+
+    assert [card["id"] for card in second.json()] == cards[5:10]
+
+
+def test_fields_projection(cards, client):
+    response = client.get("/cards", params={"limit": 2, "fields": "id,card_name"})
+
+    assert all(set(card) == {"id", "card_name"} for card in response.json())
+
+
+def test_invalid_cursor_is_rejected(client, tables):
+    assert client.get("/cards", params={"cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+import analysis
+from database import AsyncSessionLocal, SessionLocal
+from image_fingerprint import (
+    ANALYSIS_CACHE_THRESHOLD, dhash, find_cached_analysis, hamming_distance, store_analysis
+)
+from inference import gemini
+from models import AnalysisFingerprint
+
+EXIF_ORIENTATION = 0x0112
+
+
+def card_image(seed: int) -> Image.Image:
+    """A synthetic card: blocks of contrasting tone laid out differently per seed"""
+    image = Image.new("RGB", (630, 880), (240, 230, 200))
+    draw = ImageDraw.Draw(image)
+    for index in range(12):
+        x = (seed * 97 + index * 53) % 500
+        y = (seed * 61 + index * 89) % 760
+        shade = (seed * 40 + index * 23) % 255
+        draw.rectangle((x, y, x + 120, y + 110), fill=(shade, 255 - shade, (shade * 3) % 255))
+    return image
+
+
+def encode(image: Image.Image, **save_args) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", **save_args)
+    return buffer.getvalue()
+
+
+def test_reencoded_and_resized_upload_matches():
+    original = card_image(1)
+    rescan = original.resize((420, 587))
+
+    distance = hamming_distance(dhash(encode(original, quality=95)), dhash(encode(rescan, quality=60)))
+
+    assert distance <= ANALYSIS_CACHE_THRESHOLD
+
+
+def test_exif_orientation_is_applied_before_hashing():
+    upright = card_image(2)
+    # Stored sideways with "rotate 90° clockwise to display", as phone cameras do
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    sideways = encode(upright.transpose(Image.Transpose.ROTATE_90), quality=95, exif=exif)
+
+    assert hamming_distance(dhash(encode(upright, quality=95)), dhash(sideways)) <= ANALYSIS_CACHE_THRESHOLD
+
+
+def test_different_cards_do_not_match():
+    distance = hamming_distance(dhash(encode(card_image(3))), dhash(encode(card_image(4))))
+
+    assert distance > ANALYSIS_CACHE_THRESHOLD
+
+
+def test_lookup_respects_the_threshold(tables):
+    image_hash = dhash(encode(card_image(5)))
+    db = SessionLocal()
+    try:
+        store_analysis(db, image_hash, {"card_name": "Stored"})
+        db.commit()
+
+        near = image_hash ^ 0b111  # 3 bits away
+        far = image_hash ^ (2 ** 64 - 1)  # every bit flipped
+
+        assert find_cached_analysis(db, near, threshold=3) == {"card_name": "Stored"}
+        assert find_cached_analysis(db, near, threshold=2) is None
+        assert find_cached_analysis(db, far) is None
+    finally:
+        db.query(AnalysisFingerprint).delete()
+        db.commit()
+        db.close()
+
+
+class FakeVisionModel:
+    """Gemini stand-in that identifies every image as the same graded card"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        condition = {"score": 9.0, "description": "Clean"}
+        text = json.dumps({
+            "card_name": "Pikachu",
+            "set_name": "Base Set",
+            "card_number": "58/102",
+            "details": "Base Set common",
+            "centering": condition, "corners": condition, "edges": condition, "surface": condition,
+            "is_authentic": True,
+        })
+        return type("Response", (), {"text": text})()
+
+
+def test_cache_hit_reuses_grading_but_resolves_a_fresh_price(tables, monkeypatch):
+    model = FakeVisionModel()
+    monkeypatch.setattr(gemini, "model", model)
+    prices = iter(["$10.00", "$25.00"])
+
+    async def fake_resolve_price(card_name, set_name):
+        return None, next(prices)
+
+    monkeypatch.setattr(analysis, "resolve_price", fake_resolve_price)
+    upload = encode(card_image(6), quality=90)
+    rescan = encode(card_image(6).resize((500, 698)), quality=70)
+
+    async def analyze_twice():
+        async with AsyncSessionLocal() as db:
+            first = await analysis.analyze_image(upload, "first.jpg", db)
+            second = await analysis.analyze_image(rescan, "rescan.jpg", db)
+        return first, second
+
+    try:
+        (first, first_status), (second, second_status) = asyncio.run(analyze_twice())
+
+        assert (first_status, second_status) == ("miss", "hit")
+        assert model.calls == 1
+        assert (first.estimated_price, second.estimated_price) == ("$10.00", "$25.00")
+        assert second.overall_grade == first.overall_grade == 9.0
+        assert second.card_name == "Pikachu"
+
+        db = SessionLocal()
+        stored = json.loads(db.query(AnalysisFingerprint.analysis_json).scalar())
+        db.close()
+        assert "estimated_price" not in stored and "market_price" not in stored
+    finally:
+        db = SessionLocal()
+        db.query(AnalysisFingerprint).delete()
+        db.commit()
+        db.close()
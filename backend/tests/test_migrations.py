@@ -0,0 +1,86 @@
+import hashlib
+import os
+
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+
+from conftest import BACKEND_DIR, TEST_DIR
+from image_store import image_path, load_image
+
+
+def _alembic_config(connection) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.attributes["connection"] = connection
+    return config
+
+
+def _legacy_database(name: str, blobs):
+    """A database as created before 0001: images stored inline in pokemon_cards"""
+    engine = sa.create_engine(f"sqlite:///{os.path.join(TEST_DIR, name)}")
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            "CREATE TABLE pokemon_cards ("
+            "id INTEGER PRIMARY KEY, card_name VARCHAR(255) NOT NULL, image_data BLOB)"
+        ))
+        for card_id, blob in enumerate(blobs, start=1):
+            connection.execute(
+                sa.text("INSERT INTO pokemon_cards (id, card_name, image_data) VALUES (:id, :name, :blob)"),
+                {"id": card_id, "name": f"Card {card_id}", "blob": blob}
+            )
+    return engine
+
+
+def test_0001_moves_blobs_into_the_image_store():
+    blobs = [b"first image", b"second image", None, b"first image"]
+    engine = _legacy_database("legacy_upgrade.db", blobs)
+
+    with engine.begin() as connection:
+        command.upgrade(_alembic_config(connection), "0001")
+
+    with engine.connect() as connection:
+        columns = {column["name"] for column in sa.inspect(connection).get_columns("pokemon_cards")}
+        rows = connection.execute(sa.text(
+            "SELECT id, image_sha256, image_size FROM pokemon_cards ORDER BY id")).all()
+
+    assert "image_data" not in columns
+    for (card_id, image_sha256, image_size), blob in zip(rows, blobs):
+        if blob is None:
+            assert image_sha256 is None and image_size is None
+            continue
+        assert image_sha256 == hashlib.sha256(blob).hexdigest()
+        assert image_size == len(blob)
+        assert load_image(image_sha256) == blob
+    # Identical images share one stored file
+    assert rows[0].image_sha256 == rows[3].image_sha256
+    assert image_path(rows[0].image_sha256).exists()
+
+
+def test_0001_downgrade_restores_blobs():
+    blobs = [b"round trip", None]
+    engine = _legacy_database("legacy_downgrade.db", blobs)
+
+    with engine.begin() as connection:
+        command.upgrade(_alembic_config(connection), "0001")
+    with engine.begin() as connection:
+        command.downgrade(_alembic_config(connection), "base")
+
+    with engine.connect() as connection:
+        columns = {column["name"] for column in sa.inspect(connection).get_columns("pokemon_cards")}
+        restored = connection.execute(sa.text(
+            "SELECT image_data FROM pokemon_cards ORDER BY id")).scalars().all()
+
+    assert "image_sha256" not in columns
+    assert restored == blobs
+
+
+def test_0001_is_a_no_op_on_a_current_schema(tables):
+    from database import engine
+
+    with engine.begin() as connection:
+        command.upgrade(_alembic_config(connection), "head")
+        columns = {column["name"] for column in sa.inspect(connection).get_columns("pokemon_cards")}
+
+    assert {"image_sha256", "image_size"} <= columns
+    assert "image_data" not in columns
@@ -0,0 +1,144 @@
+import asyncio
+import time
+
+import pytest
+
+import analysis
+from analysis import resolve_price
+from pokemon_api import pokemon_api
+
+PRICED_CARD = {"name": "Pikachu", "set": "Base Set", "prices": {"market": 12.5}}
+UNPRICED_CARD = {"name": "Pikachu", "set": "Base Set", "rarity": "Common", "prices": {}}
+
+HEDGE_DELAY = 0.05
+BUDGET = 0.5
+
+
+class FakeSource:
+    """Async stand-in for an upstream: answers after `delay` seconds, or raises `error`"""
+
+    def __init__(self, result=None, delay=0.0, error=None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.started_at = None
+        self.cancelled = False
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    def install(api=None, ai=None, api_key="test-key"):
+        monkeypatch.setattr(pokemon_api, "api_key", api_key)
+        if api is not None:
+            monkeypatch.setattr(pokemon_api, "get_card_with_psa_data", api)
+        if ai is not None:
+            monkeypatch.setattr(analysis, "estimate_price_with_ai", ai)
+    return install
+
+
+def _resolve():
+    started = time.monotonic()
+    result = asyncio.run(resolve_price("Pikachu", "Base Set", hedge_delay=HEDGE_DELAY, budget=BUDGET))
+    return result, started
+
+
+def test_fast_api_price_wins_without_asking_gemini(sources):
+    api, ai = FakeSource(PRICED_CARD), FakeSource("$9.99")
+    sources(api, ai)
+
+    (card_data, estimate), _ = _resolve()
+
+    assert card_data == PRICED_CARD
+    assert estimate is None
+    assert ai.calls == 0
+
+
+def test_slow_api_is_hedged_and_the_ai_estimate_wins(sources):
+    api, ai = FakeSource(PRICED_CARD, delay=5), FakeSource("$9.99")
+    sources(api, ai)
+
+    (card_data, estimate), started = _resolve()
+
+    assert (card_data, estimate) == (None, "$9.99")
+    # The estimate was only requested once the hedge delay had passed
+    assert ai.started_at - started >= HEDGE_DELAY * 0.9
+    # ...and the slower lookup was abandoned
+    assert api.cancelled
+
+
+def test_api_answer_arriving_during_the_hedge_still_wins(sources):
+    api, ai = FakeSource(PRICED_CARD, delay=HEDGE_DELAY * 2), FakeSource("$9.99", delay=5)
+    sources(api, ai)
+
+    (card_data, estimate), _ = _resolve()
+
+    assert (card_data, estimate) == (PRICED_CARD, None)
+    assert ai.calls == 1 and ai.cancelled
+
+
+def test_card_not_found_asks_gemini_without_waiting_for_the_hedge(sources):
+    api, ai = FakeSource(None), FakeSource("$4.00")
+    sources(api, ai)
+
+    (card_data, estimate), started = _resolve()
+
+    assert (card_data, estimate) == (None, "$4.00")
+    assert ai.started_at - started < HEDGE_DELAY
+
+
+def test_unpriced_api_match_keeps_its_details_alongside_the_estimate(sources):
+    api, ai = FakeSource(UNPRICED_CARD), FakeSource("$4.00")
+    sources(api, ai)
+
+    (card_data, estimate), _ = _resolve()
+
+    assert (card_data, estimate) == (UNPRICED_CARD, "$4.00")
+
+
+def test_api_error_falls_back_to_gemini(sources):
+    api, ai = FakeSource(error=RuntimeError("upstream down")), FakeSource("$4.00")
+    sources(api, ai)
+
+    assert _resolve()[0] == (None, "$4.00")
+
+
+def test_no_api_key_uses_gemini_only(sources):
+    api, ai = FakeSource(PRICED_CARD), FakeSource("$4.00")
+    sources(api, ai, api_key=None)
+
+    assert _resolve()[0] == (None, "$4.00")
+    assert api.calls == 0
+
+
+def test_both_sources_failing_gives_no_price(sources):
+    api, ai = FakeSource(None), FakeSource(error=RuntimeError("quota"))
+    sources(api, ai)
+
+    assert _resolve()[0] == (None, None)
+
+
+def test_budget_caps_the_pricing_stage(sources):
+    api, ai = FakeSource(PRICED_CARD, delay=5), FakeSource("$9.99", delay=5)
+    sources(api, ai)
+    exceeded_before = analysis.price_hedge_counts["budget_exceeded"]
+
+    (card_data, estimate), started = _resolve()
+    elapsed = time.monotonic() - started
+
+    assert (card_data, estimate) == (None, None)
+    assert BUDGET * 0.9 <= elapsed < BUDGET + 0.5
+    assert api.cancelled and ai.cancelled
+    assert analysis.price_hedge_counts["budget_exceeded"] == exceeded_before + 1
@@ -49,6 +49,8 @@ export default function Collection() {
     const [loading, setLoading] = useState(true)
     const [error, setError] = useState<string | null>(null)
     const [priceChanges, setPriceChanges] = useState<Record<number, PriceChange>>({})
+    const [nextCursor, setNextCursor] = useState<string | null>(null)
+    const [loadingMore, setLoadingMore] = useState(false)
 
     useEffect(() => {
         fetchCards()
@@ -60,18 +62,24 @@ export default function Collection() {
         }
     }, [cards])
 
-    const fetchCards = async () => {
+    const CARDS_PAGE_SIZE = 60
+
+    const fetchCards = async (cursor: string | null = null) => {
+        if (cursor) setLoadingMore(true)
         try {
-            const response = await fetch('http://localhost:8000/cards')
-            if (!response.ok) {
-                throw new Error('Failed to fetch cards')
-            }
-            const data = await response.json()
-            setCards(data)
+            // One page at a time; X-Next-Cursor is absent on the last page
+            const params = new URLSearchParams({ limit: String(CARDS_PAGE_SIZE) })
+            if (cursor) params.set('cursor', cursor)
+            const response = await fetch(`http://localhost:8000/cards?${params}`)
+            if (!response.ok) throw new Error('Failed to fetch cards')
+            const data: Card[] = await response.json()
+            setCards(prev => cursor ? [...prev, ...data] : data)
+            setNextCursor(response.headers.get('X-Next-Cursor'))
         } catch (err) {
             setError(err instanceof Error ? err.message : 'An error occurred')
         } finally {
             setLoading(false)
+            setLoadingMore(false)
         }
     }
 
@@ -194,7 +202,7 @@ export default function Collection() {
                                         <>
                                             <img
                                                 key={card.id}
-                                                src={`http://localhost:8000/cards/${card.id}/image?v=${card.id}`}
+                                                src={`http://localhost:8000/cards/${card.id}/image?w=384&format=webp`}
                                                 alt={card.card_name}
                                                 className="w-full h-full object-contain p-4"
                                                 onError={(e) => {
@@ -347,6 +355,19 @@ export default function Collection() {
                         ))}
                     </div>
                 )}
+
+                {/* Load More */}
+                {nextCursor && (
+                    <div className="text-center mt-10">
+                        <button
+                            onClick={() => fetchCards(nextCursor)}
+                            disabled={loadingMore}
+                            className="px-8 py-3 bg-[#0078ff] hover:bg-[#0060d9] text-white font-bold rounded-lg transition-colors disabled:opacity-50 disabled:cursor-not-allowed shadow-sm"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </main>
         </div>
     )
@@ -43,7 +43,13 @@ export default function PortfolioChart({ cardId, timeRange, height = 300 }: Port
             let response
             if (cardId) {
                 // Fetch individual card price history
-                response = await fetch(`http://localhost:8000/cards/${cardId}/price-history`)
+                // Server limits the range and downsamples to a fixed number of points
+                const params = new URLSearchParams({ max_points: '200' })
+                const rangeDays = { '1d': 1, '1m': 30, '3m': 90, '1y': 365 }[timeRange as string]
+                if (rangeDays) {
+                    params.set('from', new Date(Date.now() - rangeDays * 24 * 60 * 60 * 1000).toISOString())
+                }
+                response = await fetch(`http://localhost:8000/cards/${cardId}/price-history?${params}`)
                 if (!response.ok) throw new Error('Failed to fetch card price history')
                 const priceHistory = await response.json()
 
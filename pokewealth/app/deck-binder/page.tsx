@@ -58,6 +58,8 @@ export default function DeckBinder() {
     const [newBinderName, setNewBinderName] = useState('')
     const [selectedCards, setSelectedCards] = useState<Card[]>([])
     const [generatingWithAI, setGeneratingWithAI] = useState(false)
+    const [nextCursor, setNextCursor] = useState<string | null>(null)
+    const [loadingMore, setLoadingMore] = useState(false)
 
     useEffect(() => {
         fetchCards()
@@ -65,16 +67,24 @@ export default function DeckBinder() {
         fetchBinders()
     }, [])
 
-    const fetchCards = async () => {
+    const CARDS_PAGE_SIZE = 60
+
+    const fetchCards = async (cursor: string | null = null) => {
+        if (cursor) setLoadingMore(true)
         try {
-            const response = await fetch('http://localhost:8000/cards')
+            // One page at a time; X-Next-Cursor is absent on the last page
+            const params = new URLSearchParams({ limit: String(CARDS_PAGE_SIZE) })
+            if (cursor) params.set('cursor', cursor)
+            const response = await fetch(`http://localhost:8000/cards?${params}`)
             if (!response.ok) throw new Error('Failed to fetch cards')
-            const data = await response.json()
-            setCards(data)
+            const data: Card[] = await response.json()
+            setCards(prev => cursor ? [...prev, ...data] : data)
+            setNextCursor(response.headers.get('X-Next-Cursor'))
         } catch (err) {
             setError(err instanceof Error ? err.message : 'An error occurred')
         } finally {
             setLoading(false)
+            setLoadingMore(false)
         }
     }
 
@@ -462,7 +472,7 @@ export default function DeckBinder() {
                                                 >
                                                     {card.image_filename ? (
                                                         <img
-                                                            src={`http://localhost:8000/cards/${card.id}/image`}
+                                                            src={`http://localhost:8000/cards/${card.id}/image?w=256&format=webp`}
                                                             alt={card.card_name}
                                                             className="w-full h-32 object-contain rounded-lg"
                                                         />
@@ -489,6 +499,15 @@ export default function DeckBinder() {
                                                 </div>
                                             ))}
                                         </div>
+                                        {nextCursor && (
+                                            <button
+                                                onClick={() => fetchCards(nextCursor)}
+                                                disabled={loadingMore}
+                                                className="mt-2 text-sm font-bold text-[#0078ff] hover:text-[#0060d9] disabled:opacity-50 disabled:cursor-not-allowed"
+                                            >
+                                                {loadingMore ? 'Loading...' : 'Load more cards'}
+                                            </button>
+                                        )}
                                     </div>
 
                                     <div className="flex gap-3">
@@ -715,7 +734,7 @@ export default function DeckBinder() {
                                                                     {card.id && card.id > 0 ? (
                                                                         <>
                                                                             <img
-                                                                                src={`http://localhost:8000/cards/${card.id}/image`}
+                                                                                src={`http://localhost:8000/cards/${card.id}/image?w=384&format=webp`}
                                                                                 alt={card.card_name}
                                                                                 className="w-full h-full object-cover rounded-lg"
                                                                                 onError={(e) => {